@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" BackgroundWorker.py
+
+    A small pool of worker threads for running slow calculations off the GUI
+    thread.
+
+    Each request is submitted under a key.  Submitting a new request for a
+    key supersedes any earlier request for that same key: if the earlier
+    request hasn't started yet it is dropped, and if it is already running
+    its result is thrown away.  This means that only the result of the most
+    recent request for each key is ever delivered.
+
+    Requests can also be debounced: a request submitted with a delay doesn't
+    start running until the delay has passed, so a burst of requests for the
+    same key (eg, one per keystroke) results in just one calculation.
+
+    Results are delivered by calling the 'post' function passed to our
+    initializer, which should arrange for the result callback to be run on
+    the GUI thread -- for wxPython programs, pass wx.CallAfter.
+"""
+
+import threading
+import time
+
+try:
+    import Queue as queue # Python 2.
+except ImportError:
+    import queue
+
+#############################################################################
+
+class BackgroundWorker(object):
+    """ A pool of worker threads delivering the latest result for each key.
+    """
+    def __init__(self, numThreads=2, post=None, delay=0.0):
+        """ Standard initializer.
+
+            'numThreads' is the number of worker threads to use.  The threads
+            are started when the first request is submitted.
+
+            'post' is the function used to deliver results back to the GUI
+            thread.  It is called as post(callback).  If this is None,
+            callbacks are run directly on the worker thread.
+
+            'delay' is the default debounce delay for our requests, in
+            seconds.
+        """
+        self._numThreads = numThreads
+        self._post       = post
+        self._delay      = delay
+        self._queue      = queue.Queue()
+        self._lock       = threading.Lock()
+        self._threads    = []
+        self._current    = {} # Maps key -> generation of latest request.
+        self._generation = 0
+
+
+    def submit(self, key, func, args=(), onResult=None, onError=None,
+               delay=None):
+        """ Submit a request to be run in the background.
+
+            We call func(*args) on one of our worker threads.  If this is
+            still the latest request for 'key' when it finishes, onResult is
+            called with the result.  If 'func' raises an exception, onError
+            is called with the exception instead.
+
+            'delay' is the number of seconds to wait before starting the
+            request; if this is None, our default delay is used.
+        """
+        if delay == None:
+            delay = self._delay
+
+        with self._lock:
+            self._startThreads()
+            self._generation = self._generation + 1
+            generation = self._generation
+            self._current[key] = generation
+
+        self._queue.put((key, generation, time.time() + delay,
+                         func, args, onResult, onError))
+
+
+    def cancel(self, key):
+        """ Cancel any outstanding request for the given key.
+        """
+        with self._lock:
+            if key in self._current:
+                del self._current[key]
+
+
+    def isPending(self, key):
+        """ Return True if there is an outstanding request for the given key.
+        """
+        with self._lock:
+            return key in self._current
+
+
+    def setDelay(self, delay):
+        """ Change the default debounce delay for our requests, in seconds.
+
+            This applies to requests submitted from now on.
+        """
+        self._delay = delay
+
+
+    def shutdown(self):
+        """ Stop our worker threads once the outstanding requests are done.
+        """
+        with self._lock:
+            self._current.clear()
+            threads = self._threads
+            self._threads = []
+
+        for thread in threads:
+            self._queue.put(None)
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _startThreads(self):
+        """ Start our worker threads, if they haven't been started already.
+
+            Note that the caller must hold self._lock.
+        """
+        while len(self._threads) < self._numThreads:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+
+    def _isCurrent(self, key, generation):
+        """ Return True if the given request is still the latest for its key.
+        """
+        with self._lock:
+            return self._current.get(key) == generation
+
+
+    def _run(self):
+        """ The main loop for each of our worker threads.
+        """
+        while True:
+            request = self._queue.get()
+            if request == None:
+                return
+
+            key,generation,startAt,func,args,onResult,onError = request
+
+            if not self._isCurrent(key, generation):
+                continue # Superseded before it started.
+
+            remaining = startAt - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+                if not self._isCurrent(key, generation):
+                    continue # Superseded while we were debouncing.
+
+            try:
+                result = func(*args)
+            except Exception as e:
+                self._deliver(key, generation, onError, e)
+            else:
+                self._deliver(key, generation, onResult, result)
+
+
+    def _deliver(self, key, generation, callback, value):
+        """ Deliver the result of a request back to the GUI thread.
+
+            We check again on the GUI thread that the request hasn't been
+            superseded, as a newer request may have been submitted while
+            this result was on its way.
+        """
+        if not self._isCurrent(key, generation):
+            return
+
+        def deliver():
+            with self._lock:
+                if self._current.get(key) != generation:
+                    return
+                del self._current[key]
+            if callback != None:
+                callback(value)
+
+        if self._post != None:
+            self._post(deliver)
+        else:
+            deliver()
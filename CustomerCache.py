@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" CustomerCache.py
+
+    An in-memory cache of selected Customer attributes.
+
+    The DetailsPanel needs to know a few attributes of the job's customer
+    (whether the customer requires a POD, etc) every time the customer field
+    changes.  Rather than selecting the Customer record from the database each
+    time, we keep the attributes we need in memory.  The cache can be warmed
+    with a single bulk query when the editor starts up; after that, customers
+    are only selected individually if they are new or their cached attributes
+    have expired.
+
+    Cached attributes expire after a given time-to-live, and can be
+    invalidated explicitly by calling invalidate() whenever a Customer record
+    is edited.
+"""
+
+import threading
+import time
+
+#############################################################################
+
+class CustomerCache(object):
+    """ A cache of attributes for Customer records.
+    """
+    def __init__(self, select, columns, ttl=600):
+        """ Standard initializer.
+
+            'select' is the function to use to select Customer records from
+            the database.  It is called as select(table, columns, where), in
+            the same way as Database.select().
+
+            'columns' is a list of the Customer columns to cache.
+
+            'ttl' is the number of seconds to keep cached attributes for, or
+            None to keep them until they are invalidated.
+        """
+        self._select         = select
+        self._columns        = list(columns)
+        self._ttl            = ttl
+        self._lock           = threading.RLock()
+        self._entries        = {} # Maps customer ID -> (expiry time, attributes).
+        self._warm           = False
+        self._selects        = 0
+        self._selectsAvoided = 0
+
+
+    def warm(self):
+        """ Prefetch all the Customer records, if we haven't done so already.
+        """
+        if not self._warm:
+            self.prefetch()
+
+
+    def prefetch(self, customerIds=None):
+        """ Load the attributes for several customers in one bulk query.
+
+            If 'customerIds' is None, the attributes for every customer are
+            loaded.  Otherwise, this should be a list of the IDs of the
+            customers to load; customers which are already cached (and
+            haven't expired) aren't selected again, and if they are all
+            cached, no query is made at all.
+
+            We return a dictionary mapping the string form of each of the
+            given customer IDs to its attributes.  Looking customers up this
+            way doesn't count towards the 'selectsAvoided' statistic.
+        """
+        if customerIds == None:
+            where = "1=1"
+        else:
+            customerIds = [str(customerId) for customerId in customerIds
+                           if customerId not in [-1, None]]
+            with self._lock:
+                missing = [customerId for customerId in customerIds
+                           if self._getCached(customerId) == None]
+            if len(missing) == 0:
+                return self._getAttributes(customerIds)
+            where = "id IN (" + ",".join(missing) + ")"
+
+        results = self._select("Customer", ["id"] + self._columns, where)
+
+        with self._lock:
+            self._selects = self._selects + 1
+            expiry = self._calcExpiry()
+            for row in results:
+                self._entries[str(row.get("id"))] = (expiry, row)
+            if customerIds == None:
+                self._warm = True
+                return {}
+            # Remember customers which don't exist, too.
+            for customerId in missing:
+                if customerId not in self._entries:
+                    self._entries[customerId] = (expiry, {})
+
+        return self._getAttributes(customerIds)
+
+
+    def get(self, customer):
+        """ Return the cached attributes for the given customer.
+
+            We return a dictionary mapping column name to value.  If the
+            customer's attributes are not cached (or have expired), we select
+            them from the database.  An empty dictionary is returned if there
+            is no such customer.
+        """
+        if customer in [-1, None]:
+            return {}
+
+        key = str(customer)
+        with self._lock:
+            attributes = self._getCached(key)
+            if attributes != None:
+                self._selectsAvoided = self._selectsAvoided + 1
+                return attributes
+
+        results = self._select("Customer", self._columns, "id=" + key)
+        if len(results) == 1:
+            attributes = results[0]
+        else:
+            attributes = {}
+
+        with self._lock:
+            self._selects = self._selects + 1
+            self._entries[key] = (self._calcExpiry(), attributes)
+
+        return attributes
+
+
+    def invalidate(self, customer=None):
+        """ Throw away the cached attributes for the given customer.
+
+            This should be called whenever a Customer record is edited.  If
+            'customer' is None, the entire cache is thrown away.
+        """
+        with self._lock:
+            if customer == None:
+                self._entries.clear()
+                self._warm = False
+            else:
+                key = str(customer)
+                if key in self._entries:
+                    del self._entries[key]
+
+
+    def getStats(self):
+        """ Return a dictionary with statistics about our cache usage.
+
+            The dictionary has the following entries:
+
+                'size'           -- The number of customers in the cache.
+                'selects'        -- The number of database selects we've made.
+                'selectsAvoided' -- The number of lookups answered from the
+                                    cache rather than the database.
+        """
+        with self._lock:
+            return {'size'           : len(self._entries),
+                    'selects'        : self._selects,
+                    'selectsAvoided' : self._selectsAvoided}
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _getCached(self, key):
+        """ Return the cached attributes for the given customer ID string.
+
+            We return None if the customer isn't cached or has expired.  Note
+            that the caller must hold self._lock.
+        """
+        entry = self._entries.get(key)
+        if entry == None:
+            return None
+        expiry,attributes = entry
+        if expiry != None and expiry <= time.time():
+            return None
+        return attributes
+
+
+    def _getAttributes(self, keys):
+        """ Return a dictionary mapping each of the given customer ID strings
+            to its cached attributes.
+
+            Customers which aren't cached are given empty attributes.
+        """
+        results = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry != None:
+                    results[key] = entry[1]
+                else:
+                    results[key] = {}
+        return results
+
+
+    def _calcExpiry(self):
+        """ Return the expiry time for attributes cached right now.
+        """
+        if self._ttl == None:
+            return None
+        else:
+            return time.time() + self._ttl
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" DeliveryTimeEngine.py
+
+    Incremental calculation of a job's delivery times.
+
+    The time panel of the DetailsPanel shows two derived delivery times:
+
+        calculatedDeliveryTime -- When the job should be delivered.  This is
+                                  the transit time between the pickup and
+                                  dropoff zones, in business hours, added to
+                                  the time the job was picked up (or, if it
+                                  hasn't been picked up yet, the time it is
+                                  ready at).
+
+        actualDeliveryTime     -- The delivery time to use for the job: the
+                                  delivery time override, if the job has one,
+                                  or the calculated delivery time otherwise.
+                                  See getActualDeliveryTime().
+
+    Note that the job's "deliver by" time doesn't affect either of these; it
+    is the deadline the actual delivery time is compared against to see if
+    the job is late.
+
+    The business hours, holidays and zone-to-zone transit times are held in
+    memory (see BusinessCalendar and TransitTable), so no database access is
+    needed to recalculate the delivery times.  Until these tables have been
+    supplied, the calculated delivery time isn't recalculated, although the
+    actual delivery time still follows the delivery time override.  A DeliveryTimeState keeps track
+    of one job's input values, and when an input changes, only the derived
+    times which depend on that input are recalculated.
+
+    This module doesn't use wx.
+"""
+
+import datetime
+
+#############################################################################
+
+# The input fields each derived field depends on.  Note that derived fields
+# may depend on other derived fields; DERIVED_FIELDS lists the derived fields
+# in the order they need to be calculated.
+
+DEPENDENCIES = {
+    'calculatedDeliveryTime' : ["readyAt", "timePickedUp",
+                                "pickupZone", "dropoffZone"],
+    'actualDeliveryTime'     : ["calculatedDeliveryTime",
+                                "hasDeliveryTimeOverride",
+                                "deliveryTimeOverride"],
+}
+
+DERIVED_FIELDS = ["calculatedDeliveryTime", "actualDeliveryTime"]
+
+INPUT_FIELDS = ["readyAt", "timePickedUp", "pickupZone", "dropoffZone",
+                "hasDeliveryTimeOverride", "deliveryTimeOverride"]
+
+#############################################################################
+
+def getActualDeliveryTime(calculatedDeliveryTime, hasDeliveryTimeOverride,
+                          deliveryTimeOverride):
+    """ Return the delivery time to use for a job.
+
+        This is the single definition of how a delivery time override is
+        applied: the override is used if the job has one, and otherwise the
+        calculated delivery time is used.
+    """
+    if isTrue(hasDeliveryTimeOverride) and deliveryTimeOverride != None:
+        return deliveryTimeOverride
+    else:
+        return calculatedDeliveryTime
+
+
+def isTrue(value):
+    """ Return True if the given boolean field value is set.
+
+        Boolean values may be stored as True/False or as "true"/"false".
+    """
+    return value == True or value == "true"
+
+#############################################################################
+
+class BusinessCalendar(object):
+    """ Our business hours and holidays.
+    """
+    def __init__(self, openTime=datetime.time(8, 0),
+                 closeTime=datetime.time(18, 0), workdays=[0, 1, 2, 3, 4],
+                 holidays=[]):
+        """ Standard initializer.
+
+            'openTime' and 'closeTime' are the datetime.time values at which
+            each business day starts and ends.  'workdays' is a list of the
+            days of the week (Monday = 0) we work on, and 'holidays' is a
+            list of datetime.date values we don't work on.
+        """
+        self._openTime  = openTime
+        self._closeTime = closeTime
+        self._workdays  = set(workdays)
+        self._holidays  = set(holidays)
+        self._days      = {} # Maps date -> (open, close) datetimes, or None.
+
+
+    def precompute(self, startDate, numDays):
+        """ Calculate the business hours for the given range of dates ahead
+            of time.
+        """
+        for i in range(numDays):
+            self.getBusinessHours(startDate + datetime.timedelta(days=i))
+
+
+    def getBusinessHours(self, date):
+        """ Return the (open, close) datetimes for the given date.
+
+            We return None if the given date isn't a business day.
+        """
+        hours = self._days.get(date, False)
+        if hours == False:
+            if date.weekday() in self._workdays and date not in self._holidays:
+                hours = (datetime.datetime.combine(date, self._openTime),
+                         datetime.datetime.combine(date, self._closeTime))
+            else:
+                hours = None
+            self._days[date] = hours
+        return hours
+
+
+    def addBusinessMinutes(self, start, minutes):
+        """ Return the datetime 'minutes' business minutes after 'start'.
+
+            Time outside of business hours doesn't count; if 'start' is
+            outside business hours, we start counting from the beginning of
+            the next business day.
+        """
+        remaining = datetime.timedelta(minutes=minutes)
+        current   = start
+        for i in range(3660): # Give up after ten years of holidays.
+            hours = self.getBusinessHours(current.date())
+            if hours != None:
+                openAt,closeAt = hours
+                if current < openAt:
+                    current = openAt
+                if current < closeAt:
+                    available = closeAt - current
+                    if remaining <= available:
+                        return current + remaining
+                    remaining = remaining - available
+            # Move on to the start of the next day.
+            current = datetime.datetime.combine(current.date() +
+                                                datetime.timedelta(days=1),
+                                                datetime.time(0, 0))
+        return None
+
+
+class TransitTable(object):
+    """ The transit time, in business minutes, between each pair of zones.
+    """
+    def __init__(self, transitTimes={}, defaultMinutes=120):
+        """ Standard initializer.
+
+            'transitTimes' maps (pickupZone, dropoffZone) tuples to the
+            number of business minutes it takes to deliver a job between
+            those zones.  'defaultMinutes' is used for zone pairs not in the
+            table.
+        """
+        self._transitTimes   = dict(transitTimes)
+        self._defaultMinutes = defaultMinutes
+
+
+    def getTransitMinutes(self, pickupZone, dropoffZone):
+        """ Return the transit time between the given zones, in minutes.
+        """
+        return self._transitTimes.get((pickupZone, dropoffZone),
+                                      self._defaultMinutes)
+
+#############################################################################
+
+class DeliveryTimeEngine(object):
+    """ Calculates derived delivery times from a job's input fields.
+    """
+    def __init__(self, calendar=None, transitTable=None):
+        """ Standard initializer.
+
+            'calendar' is our BusinessCalendar, and 'transitTable' our
+            TransitTable.  Until both of these have been set, the engine
+            isn't configured and the calculated delivery time can't be
+            recalculated; see canCalculate().
+        """
+        self.calendar     = calendar
+        self.transitTable = transitTable
+
+
+    def isConfigured(self):
+        """ Return True if our business calendar and transit table are set.
+        """
+        return self.calendar != None and self.transitTable != None
+
+
+    def canCalculate(self, field):
+        """ Return True if we are able to calculate the given derived field.
+
+            The calculated delivery time needs our business calendar and
+            transit table, while the actual delivery time can always be
+            worked out.
+        """
+        if field == "calculatedDeliveryTime":
+            return self.isConfigured()
+        else:
+            return True
+
+
+    def calculate(self, field, values):
+        """ Calculate the given derived field from the given field values.
+        """
+        if field == "calculatedDeliveryTime":
+            start = values.get("timePickedUp")
+            if start == None:
+                start = values.get("readyAt")
+            if start == None:
+                return None
+            minutes = self.transitTable.getTransitMinutes(values.get("pickupZone"),
+                                                          values.get("dropoffZone"))
+            return self.calendar.addBusinessMinutes(start, minutes)
+        elif field == "actualDeliveryTime":
+            return getActualDeliveryTime(values.get("calculatedDeliveryTime"),
+                                         values.get("hasDeliveryTimeOverride"),
+                                         values.get("deliveryTimeOverride"))
+        else:
+            raise ValueError("Unknown derived field: " + field)
+
+#############################################################################
+
+class DeliveryTimeState(object):
+    """ The delivery time inputs and derived values for a single job.
+    """
+    def __init__(self, engine):
+        """ Standard initializer.
+        """
+        self._engine = engine
+        self._values = {}
+
+        # Maps each field to the derived fields which directly depend on it.
+        self._dependents = {}
+        for derived in DERIVED_FIELDS:
+            for field in DEPENDENCIES[derived]:
+                self._dependents.setdefault(field, []).append(derived)
+
+
+    def load(self, rec):
+        """ Load the input and derived values from the given job record.
+
+            The derived values are taken from the record as-is, rather than
+            being recalculated, so loading a job doesn't change it.
+        """
+        self._values = {}
+        for field in INPUT_FIELDS + DERIVED_FIELDS:
+            self._values[field] = rec.get(field)
+
+
+    def getValue(self, field):
+        """ Return the current value of the given input or derived field.
+        """
+        return self._values.get(field)
+
+
+    def setInput(self, field, value):
+        """ Change the value of one of our input fields.
+
+            We recalculate the derived fields which depend on the changed
+            field, and return a dictionary mapping each derived field whose
+            value has changed to its new value.
+
+            Derived fields our engine can't calculate yet (see
+            DeliveryTimeEngine.canCalculate()) keep their loaded values.
+        """
+        if self._values.get(field) == value:
+            return {}
+        self._values[field] = value
+
+        # Work out which derived fields are affected, following the chain
+        # of dependencies.
+
+        affected = set()
+        toCheck  = [field]
+        while len(toCheck) > 0:
+            for derived in self._dependents.get(toCheck.pop(), []):
+                if derived not in affected:
+                    affected.add(derived)
+                    toCheck.append(derived)
+
+        # Recalculate the affected fields, in dependency order.  If a derived
+        # value doesn't change, the fields depending on it needn't change
+        # either, unless they depend on something else that did.
+
+        changed = {}
+        for derived in DERIVED_FIELDS:
+            if derived not in affected:
+                continue
+            inputs = DEPENDENCIES[derived]
+            if field not in inputs and \
+               len([f for f in inputs if f in changed]) == 0:
+                continue
+            if not self._engine.canCalculate(derived):
+                continue
+            value = self._engine.calculate(derived, self._values)
+            if value != self._values.get(derived):
+                self._values[derived] = value
+                changed[derived] = value
+
+        return changed
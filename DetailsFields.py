@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" DetailsFields.py
+
+    The definitions of the input fields shown by the DetailsPanel.
+
+    Each of the DetailsPanel's two sub-panels is defined by a list of
+    FieldSpec and VerticalGap objects, in tab order.  The SubPanel creates its
+    input fields from these definitions when it is first shown.
+
+    This module doesn't import wx or anything from the Framework, so tools
+    which only need to know about the Details fields (their labels, record
+    keys and so on) can use it without loading the editor.
+"""
+
+#############################################################################
+
+class FieldSpec(object):
+    """ The definition of a single input field within a SubPanel.
+    """
+    def __init__(self, attrName, label, fieldClass, key, readOnly=False,
+                 text=None, displayWidth=None, editWidth=None):
+        """ Standard initializer.
+
+            The parameters are as follows:
+
+                'attrName'     -- The name of the SubPanel attribute to store
+                                  the input field in.
+                'label'        -- The label to show for the field, or None.
+                'fieldClass'   -- The name of the shared.Editor class to use
+                                  for the input field.
+                'key'          -- The record key the field is stored in.
+                'readOnly'     -- Is the field read-only?
+                'text'         -- The text to show alongside a boolean field.
+                'displayWidth' -- The field's display width, if any.
+                'editWidth'    -- The field's edit width, if any.
+        """
+        self.attrName     = attrName
+        self.label        = label
+        self.fieldClass   = fieldClass
+        self.key          = key
+        self.readOnly     = readOnly
+        self.text         = text
+        self.displayWidth = displayWidth
+        self.editWidth    = editWidth
+
+
+class VerticalGap(object):
+    """ A vertical gap between the fields in a SubPanel.
+    """
+    def __init__(self, height):
+        """ Standard initializer.
+        """
+        self.height = height
+
+##################### Define input fields for _timePan #####################
+#
+#  Note: this ordering is REQUIRED to TAB properly from one field to the next
+#
+TIME_PANEL_FIELDS = [
+    FieldSpec("_recipientsNameField", "Recipient's Name", "TextInputField",
+              "recipientsName", displayWidth=15, editWidth=32),
+    # ------------------------------
+    VerticalGap(5),
+    # ------------------------------
+    FieldSpec("_prebookedField", None, "BooleanInputField",
+              "isPrebooked", text="Prebooked Job"),
+    FieldSpec("_readyAtField", "Ready At", "DateTimeInputField",
+              "readyAt"),
+    FieldSpec("_deliverByField", "Deliver By", "DateTimeInputField",
+              "deliverBy"),
+    # ------------------------------
+    VerticalGap(5),
+    # ------------------------------
+    FieldSpec("_timeEnteredField", "Time Entered", "DateTimeInputField",
+              "timeEntered"),
+    FieldSpec("_timeAcknowledgedField", "Time Acknowledged", "DateTimeInputField",
+              "timeAcknowledged"),
+    FieldSpec("_timePickedUpField", "Time Picked Up", "DateTimeInputField",
+              "timePickedUp"),
+    # ------------------------------
+    VerticalGap(5),
+    # ------------------------------
+    FieldSpec("_calcDeliveryTimeField", "Calculated Delivery Time", "DateTimeInputField",
+              "calculatedDeliveryTime", readOnly=True),
+    FieldSpec("_hasDeliveryTimeOverrideField", None, "BooleanInputField",
+              "hasDeliveryTimeOverride", text="Has Delivery Time Override"),
+    FieldSpec("_deliveryTimeOverrideField", "Delivery Time Override", "DateTimeInputField",
+              "deliveryTimeOverride"),
+    FieldSpec("_actualDeliveryTimeField", "Actual Delivery Time", "DateTimeInputField",
+              "actualDeliveryTime", readOnly=True),
+    FieldSpec("_lateJobExemptField", None, "BooleanInputField",
+              "lateJobExempt", text="Late Job Exempt"),
+    # ------------------------------
+    VerticalGap(5),
+    # ------------------------------
+    FieldSpec("_okayToLeaveField", None, "BooleanInputField",
+              "okayToLeave", text="OK To Leave"),
+    FieldSpec("_requiresPODField", None, "BooleanInputField",
+              "requiresPOD", text="Requires POD"),
+    FieldSpec("_requiresPODWithCallBackField", None, "BooleanInputField",
+              "requiresPODWithCallBack", text="Requires POD with Call Back"),
+    FieldSpec("_requiresPODWithEmailBackField", None, "BooleanInputField",
+              "requiresPODWithEmailBack", text="Requires POD with Email Back"),
+    # FieldSpec("_suppressDataMessageField", None, "BooleanInputField",
+    #           "suppressDataMessage", text="Suppress Data Message"),
+    # FieldSpec("_dateForBillingField", "Date For Billing", "DateTimeInputField",
+    #           "dateForBilling"),
+]
+
+# Only shown if the DetailsPanel is asked to show the "round trip" field.
+ROUND_TRIP_FIELD = FieldSpec("_roundTripField", None, "BooleanInputField",
+                             "roundTrip", text="Round Trip Job")
+
+##################### Define input fields for _pricePan #####################
+#
+#  Note: this ordering is REQUIRED to Tab properly from one field to the next
+#
+PRICE_PANEL_FIELDS = [
+    FieldSpec("_mileageField", "Mileage", "FloatInputField",
+              "mileage", readOnly=True, displayWidth=12, editWidth=12),
+    # ------------------------------
+    VerticalGap(10),
+    # ------------------------------
+    FieldSpec("_basePriceField", "Price", "MoneyInputField",
+              "basePrice", readOnly=True, displayWidth=12, editWidth=12),
+    FieldSpec("_priceModifierField", "Price Modifier", "MoneyInputField",
+              "priceModifier", readOnly=True, displayWidth=12, editWidth=12),
+    FieldSpec("_calculatedPriceField", "Calculated Price", "MoneyInputField",
+              "calculatedPrice", readOnly=True, displayWidth=12, editWidth=12),
+    FieldSpec("_defaultStandardPriceField", "DBC Standard Price ", "MoneyInputField",
+              "defaultStandardBasePrice", readOnly=True, displayWidth=12, editWidth=12),
+    # ------------------------------
+    VerticalGap(5),
+    # ------------------------------
+    FieldSpec("_hasPriceOverrideField", None, "BooleanInputField",
+              "hasPriceOverride", text="Has Price Override"),
+    FieldSpec("_priceOverrideField", "Price Override", "MoneyInputField",
+              "priceOverride", displayWidth=12, editWidth=12),
+    # ------------------------------
+    VerticalGap(10),
+    # ------------------------------
+    FieldSpec("_actualPriceField", "Actual Price To Customer", "MoneyInputField",
+              "actualPrice", readOnly=True, displayWidth=12, editWidth=12),
+]
+
+#############################################################################
+
+def getFieldSpecs():
+    """ Return a list of all the FieldSpecs for the Details fields.
+
+        This includes the "round trip" field, even though it isn't always
+        shown.
+    """
+    specs = []
+    for entry in TIME_PANEL_FIELDS + [ROUND_TRIP_FIELD] + PRICE_PANEL_FIELDS:
+        if isinstance(entry, FieldSpec):
+            specs.append(entry)
+    return specs
+
+
+def getFieldSpec(key):
+    """ Return the FieldSpec for the field with the given record key.
+
+        We return None if there is no such field.
+    """
+    for spec in getFieldSpecs():
+        if spec.key == key:
+            return spec
+    return None
+
+
+def getColumnLabel(spec):
+    """ Return the label to use for the given field in a column heading.
+
+        Boolean fields have no label of their own, so their text is used
+        instead.
+    """
+    if spec.label != None:
+        return spec.label.strip()
+    elif spec.text != None:
+        return spec.text
+    else:
+        return spec.key
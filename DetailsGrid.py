@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" DetailsGrid.py
+
+    A read-only grid showing the Details fields for many jobs at once.
+
+    Rather than creating a DetailsPanel (with all its input fields) for each
+    job, the DetailsGrid is a virtual list control: it holds only the list of
+    job IDs to show, and asks for the text of each cell as it is painted.
+    The jobs themselves are selected from the database a page at a time, as
+    the rows are scrolled into view, and only a limited number of pages are
+    kept in memory.  This means that the grid's memory use and paint time
+    don't depend on how many jobs it shows.
+
+    The grid's columns are taken from the same field definitions as the
+    DetailsPanel's input fields (see DetailsFields.py).  Note that the values
+    are formatted by the grid's own formatters (see GRID FORMATTERS, below),
+    not by the shared.Editor input field classes, so their text may differ
+    from what the DetailsPanel shows.  Example:
+
+        grid = DetailsGrid(parent)
+        grid.setJobIds(jobIds)
+"""
+
+import wx
+
+from collections import OrderedDict
+
+import DetailsFields
+import JobRecord
+
+#############################################################################
+
+# The fields to show by default, in column order.
+
+DEFAULT_COLUMNS = ["readyAt", "deliverBy", "calculatedDeliveryTime",
+                   "actualDeliveryTime", "lateJobExempt", "mileage",
+                   "basePrice", "calculatedPrice", "actualPrice",
+                   "requiresPOD", "requiresPODWithCallBack",
+                   "requiresPODWithEmailBack"]
+
+# The number of jobs to select from the database at once, and the maximum
+# number of these pages to keep in memory.
+
+PAGE_SIZE        = 50
+MAX_CACHED_PAGES = 20
+
+#############################################################################
+
+class JobPageCache(object):
+    """ A bounded cache of job records, loaded a page at a time.
+
+        This doesn't use wx, so it can be used by other views of many jobs.
+    """
+    def __init__(self, select, columns, table="Job", pageSize=PAGE_SIZE,
+                 maxPages=MAX_CACHED_PAGES):
+        """ Standard initializer.
+
+            'select' is the function to use to select the jobs from the
+            database.  It is called as select(table, columns, where), in the
+            same way as Database.select().
+
+            'columns' is a list of the job columns to load.  'pageSize' is
+            the number of jobs to load at once, and 'maxPages' is the maximum
+            number of pages to keep; the least recently used pages are
+            thrown away first.
+        """
+        self._select   = select
+        self._columns  = list(columns)
+        self._table    = table
+        self._pageSize = pageSize
+        self._maxPages = maxPages
+        self._jobIds   = []
+        self._pages    = OrderedDict() # Maps page number -> list of records.
+        self._selects  = 0
+
+
+    def setJobIds(self, jobIds):
+        """ Set the list of job IDs to load, in display order.
+
+            Any cached pages are thrown away.
+        """
+        self._jobIds = list(jobIds)
+        self._pages.clear()
+
+
+    def getCount(self):
+        """ Return the number of jobs.
+        """
+        return len(self._jobIds)
+
+
+    def getRecord(self, index):
+        """ Return the record for the job at the given index.
+
+            The job's page is loaded if it isn't already cached.  We return
+            None if the job no longer exists.
+        """
+        if index < 0 or index >= len(self._jobIds):
+            return None
+        page = self._getPage(index // self._pageSize)
+        return page[index % self._pageSize]
+
+
+    def prefetch(self, fromIndex, toIndex):
+        """ Make sure the jobs between the two indexes (inclusive) are loaded.
+        """
+        fromIndex = max(fromIndex, 0)
+        toIndex   = min(toIndex, len(self._jobIds) - 1)
+        if fromIndex > toIndex:
+            return
+        for pageNum in range(fromIndex // self._pageSize,
+                             toIndex // self._pageSize + 1):
+            self._getPage(pageNum)
+
+
+    def invalidate(self, jobId=None):
+        """ Throw away the cached record for the given job.
+
+            If 'jobId' is None, all the cached records are thrown away.
+        """
+        if jobId == None:
+            self._pages.clear()
+            return
+        for pageNum in list(self._pages.keys()):
+            start = pageNum * self._pageSize
+            if jobId in self._jobIds[start:start + self._pageSize]:
+                del self._pages[pageNum]
+
+
+    def getStats(self):
+        """ Return a dictionary with statistics about our cache usage.
+
+            The dictionary has the following entries:
+
+                'jobs'    -- The number of jobs.
+                'pages'   -- The number of pages currently cached.
+                'selects' -- The number of database selects we've made.
+        """
+        return {'jobs'    : len(self._jobIds),
+                'pages'   : len(self._pages),
+                'selects' : self._selects}
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _getPage(self, pageNum):
+        """ Return the given page of records, loading it if necessary.
+        """
+        page = self._pages.get(pageNum)
+        if page != None:
+            del self._pages[pageNum]
+            self._pages[pageNum] = page # Most recently used.
+            return page
+
+        start  = pageNum * self._pageSize
+        jobIds = self._jobIds[start:start + self._pageSize]
+
+        where   = "id IN (" + ",".join([str(jobId) for jobId in jobIds]) + ")"
+        results = self._select(self._table, ["id"] + self._columns, where)
+        self._selects = self._selects + 1
+
+        byId = {}
+        for row in results:
+            byId[str(row.get("id"))] = JobRecord.JobRecord.fromDict(row)
+        page = [byId.get(str(jobId)) for jobId in jobIds]
+
+        self._pages[pageNum] = page
+        while len(self._pages) > self._maxPages:
+            self._pages.popitem(last=False)
+        return page
+
+#############################################################################
+
+class DetailsGrid(wx.ListCtrl):
+    """ A virtual list control showing the Details fields for many jobs.
+    """
+    def __init__(self, parent, columns=DEFAULT_COLUMNS, select=None):
+        """ Standard initializer.
+
+            'columns' is a list of the record keys of the Details fields to
+            show.  'select' is the function to use to select jobs from the
+            database; by default, Database.select() is used.
+        """
+        wx.ListCtrl.__init__(self, parent, -1,
+                             style=wx.LC_REPORT | wx.LC_VIRTUAL |
+                                   wx.LC_HRULES | wx.LC_VRULES)
+
+        if select == None:
+            select = Framework.get("shared.Database").select
+
+        self._specs = []
+        for key in columns:
+            spec = DetailsFields.getFieldSpec(key)
+            if spec == None:
+                raise ValueError("Unknown Details field: " + key)
+            self._specs.append(spec)
+
+        self._pages = JobPageCache(select, [spec.key for spec in self._specs])
+
+        self.InsertColumn(0, "Job")
+        for col,spec in enumerate(self._specs):
+            if spec.fieldClass in ["FloatInputField", "MoneyInputField"]:
+                alignment = wx.LIST_FORMAT_RIGHT
+            else:
+                alignment = wx.LIST_FORMAT_LEFT
+            self.InsertColumn(col + 1, DetailsFields.getColumnLabel(spec), alignment)
+
+        self.SetItemCount(0)
+        self.Bind(wx.EVT_LIST_CACHE_HINT, self._onCacheHint)
+
+
+    def setJobIds(self, jobIds):
+        """ Show the jobs with the given IDs, in the given order.
+        """
+        self._pages.setJobIds(jobIds)
+        self.SetItemCount(self._pages.getCount())
+        self.Refresh()
+
+
+    def getRecord(self, row):
+        """ Return the job record shown in the given row, or None.
+        """
+        return self._pages.getRecord(row)
+
+
+    def refreshJob(self, jobId=None):
+        """ Reload the given job from the database next time it is shown.
+
+            This should be called whenever a job is edited.  If 'jobId' is
+            None, every job is reloaded.
+        """
+        self._pages.invalidate(jobId)
+        self.Refresh()
+
+
+    def getCacheStats(self):
+        """ Return a dictionary with statistics about our page cache.
+
+            See JobPageCache.getStats() for details.
+        """
+        return self._pages.getStats()
+
+
+    def OnGetItemText(self, row, col):
+        """ Return the text to show in the given cell.
+
+            This is called by wx for each visible cell as it is painted.
+        """
+        rec = self._pages.getRecord(row)
+        if rec == None:
+            return ""
+        if col == 0:
+            return "%s" % rec.get("id")
+        spec = self._specs[col - 1]
+        return formatValue(spec, rec.get(spec.key))
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _onCacheHint(self, event):
+        """ Respond to the list control telling us which rows it will paint.
+
+            We load all the pages covering those rows before painting starts,
+            rather than one by one as each cell is asked for.
+        """
+        self._pages.prefetch(event.GetCacheFrom(), event.GetCacheTo())
+
+#############################################################################
+#                                                                           #
+#                          G R I D   F O R M A T T E R S                    #
+#                                                                           #
+#############################################################################
+
+# The shared.Editor input field classes format their own values for display,
+# but they only do so for a live input field, and their formatting can't be
+# reached from here.  Until the editor exposes it, the grid uses the
+# following formatters, keyed by input field class.  Keep all the grid's
+# formatting here, so it can be replaced in one place.
+
+def formatValue(spec, value):
+    """ Return the given value for the given Details field, formatted as text
+        for the grid.
+    """
+    if value in [None, ""]:
+        return ""
+    formatter = _FORMATTERS.get(spec.fieldClass)
+    if formatter == None:
+        return "%s" % value
+    try:
+        return formatter(value)
+    except (TypeError, ValueError):
+        return "%s" % value
+
+
+def _formatBoolean(value):
+    """ Format the value of a BooleanInputField.
+    """
+    if value == True or value == "true":
+        return "Yes"
+    else:
+        return ""
+
+
+def _formatDateTime(value):
+    """ Format the value of a DateTimeInputField.
+    """
+    if hasattr(value, "strftime"):
+        return value.strftime("%m/%d/%Y %I:%M %p")
+    else:
+        return "%s" % value
+
+
+def _formatFloat(value):
+    """ Format the value of a FloatInputField.
+    """
+    return "%0.1f" % float(value)
+
+
+def _formatMoney(value):
+    """ Format the value of a MoneyInputField.
+    """
+    return "$%0.2f" % float(value)
+
+
+# Maps field class name -> function to format a value of that class.
+
+_FORMATTERS = {'BooleanInputField'  : _formatBoolean,
+               'DateTimeInputField' : _formatDateTime,
+               'FloatInputField'    : _formatFloat,
+               'MoneyInputField'    : _formatMoney}
@@ -32,61 +32,378 @@
     This panel listens for changes to the following fields:
 
         pickupStreetAddress  -- ignored for now.
-        pickupZone           -- ignored for now.
+        pickupZone
         pickupZipCode
         dropoffStreetAddress -- ignored for now.
-        dropoffZone          -- ignored for now.
+        dropoffZone
         dropoffZipCode
+        customer
+        readyAt
+        timePickedUp
+        hasDeliveryTimeOverride
+        deliveryTimeOverride
 
     It notifies the editor when the following fields are changed:
 
         mileage
+        calculatedDeliveryTime
+        actualDeliveryTime
 
 """
 _author_ = "Bill Golembieski 9/29/2015"
 _email_ = "BillGolembieski@projectu23.com"
 _status_ = "Prototype" #Development -> Prototype -> Production
 
-import string
+import atexit
+import logging
+import os
+import threading
 import wx
 
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import BackgroundWorker
+import CustomerCache
+import DeliveryTimeEngine
+import DetailsFields
+import LatencyStats
+import MileageCache
+import ZipDistanceMatrix
+
 # import calendar
 
-##### DateTime #####
-InputPanel         = Framework.get("shared.Editor").InputPanel
-Editor             = Framework.get("shared.Editor")
-BooleanInputField  = Framework.get("shared.Editor").BooleanInputField
-DateTimeInputField = Framework.get("shared.Editor").DateTimeInputField
-DateSelector       = Framework.get("shared.Editor").DateSelector
-DatePickerCtrl     = Framework.get("shared.Editor").DatePickerCtrl
-PopupInputField    = Framework.get("shared.Editor").PopupInputField
-Database           = Framework.get("shared.Database")
-Calculator         = Framework.get("shared.Calculator")
-
-##### Price #####
-MoneyInputField    = Framework.get("shared.Editor").MoneyInputField
-FloatInputField    = Framework.get("shared.Editor").FloatInputField
-DisplayField       = Framework.get("shared.Editor").DisplayField
-
-##### Options #####
-TextInputField     = Framework.get("shared.Editor").TextInputField
+#############################################################################
+
+_logger = logging.getLogger("DetailsPanel")
+
+_sharedModules = {} # Maps name -> shared module, once fetched.
+
+def _getShared(name):
+    """ Return the given shared module.
+
+        The module is fetched from the Framework the first time it is needed,
+        and remembered after that.  This means that we don't load the
+        database or calculator until a DetailsPanel actually uses them.
+    """
+    module = _sharedModules.get(name)
+    if module == None:
+        module = Framework.get(name)
+        _sharedModules[name] = module
+    return module
+
+# The editor is needed right away, as our panels are based on its InputPanel.
+# The input field classes are looked up in the editor module by name, when
+# each panel's fields are built; see DetailsFields.py.
+
+Editor     = _getShared("shared.Editor")
+InputPanel = Editor.InputPanel
+
+#############################################################################
+
+# The maximum number of zip pairs to remember the mileage for, and the name of
+# the file on the local disk to keep these mileages in across restarts.  By
+# default, the mileage cache is kept in memory only; call configureMileageCache()
+# at startup to change these settings.  The file is written every
+# MILEAGE_CACHE_SAVE_INTERVAL seconds if the cache has changed, and again when
+# the program exits.
+
+MILEAGE_CACHE_SIZE          = 5000
+MILEAGE_CACHE_FILE          = None
+MILEAGE_CACHE_SAVE_INTERVAL = 300
+
+_mileageCache = MileageCache.MileageCache(maxSize=MILEAGE_CACHE_SIZE,
+                                          path=MILEAGE_CACHE_FILE)
+
+# Latency profiling of our field listeners, database and calculator calls, and
+# record loading and saving.  This is off unless the DETAILS_PANEL_PROFILE
+# environment variable is set, or enableLatencyProfiling() is called.
+
+_latency = LatencyStats.LatencyRecorder(
+                enabled=os.environ.get("DETAILS_PANEL_PROFILE", "") not in ["", "0"])
+
+# The name of our precomputed zip-to-zip distance matrix, if any.  See
+# ZipDistanceMatrix.py for how to build this.  Mileages for zip pairs in the
+# matrix are looked up in it rather than being calculated by the Calculator.
+
+DISTANCE_MATRIX_NAME = None
+
+_distanceMatrix = None # Opened on first use.
+
+# Mileages not in the cache are calculated in the background.  We wait for
+# MILEAGE_DEBOUNCE_DELAY seconds after the last zip code change before starting
+# a calculation, so that typing a zip code doesn't calculate a mileage for
+# every keystroke.
+
+MILEAGE_WORKER_THREADS = 2
+MILEAGE_DEBOUNCE_DELAY = 0.3
+
+_mileageWorker = BackgroundWorker.BackgroundWorker(numThreads=MILEAGE_WORKER_THREADS,
+                                                   post=wx.CallAfter,
+                                                   delay=MILEAGE_DEBOUNCE_DELAY)
+
+# Mileages declared in a LoadPlan are calculated ahead of time on a separate
+# pool of threads, which is created when it is first needed.
+
+_prefetchPool      = None
+_prefetchLock      = threading.Lock()
+_mileagePrefetches = {} # Maps normalized zip pair -> AsyncResult.
+
+def _selectFromDatabase(table, columns, where):
+    """ Call Database.select(), recording how long it takes.
+    """
+    with _latency.timed("Database.select"):
+        return _getShared("shared.Database").select(table, columns, where)
+
+# The business hours, holidays and zone-to-zone transit times used to calculate
+# delivery times.  Call setDeliveryTimeTables() at startup to install our real
+# tables; until then, the calculated delivery time is left as it was loaded.
+
+_deliveryTimeEngine = DeliveryTimeEngine.DeliveryTimeEngine()
+
+# The Customer attributes we need, and how long (in seconds) to remember them
+# for before selecting them from the database again.
+
+CUSTOMER_POD_COLUMNS = ["jobRequiresPODWithEmailBack",
+                        "jobRequiresPOD",
+                        "jobRequiresPODWithCallBack"]
+CUSTOMER_CACHE_TTL   = 600
+
+_customerCache = CustomerCache.CustomerCache(_selectFromDatabase,
+                                             CUSTOMER_POD_COLUMNS,
+                                             ttl=CUSTOMER_CACHE_TTL)
+
+#############################################################################
+
+def invalidateMileageCache(tablesVersion=None):
+    """ Throw away all the cached mileages.
+
+        This must be called whenever the zip/zone tables used by the
+        Calculator are changed.
+    """
+    _mileageCache.invalidate(tablesVersion)
+
+
+def configureMileageCache(path, maxSize=MILEAGE_CACHE_SIZE,
+                          saveInterval=MILEAGE_CACHE_SAVE_INTERVAL):
+    """ Set up our mileage cache.
+
+        'path' is the name of the file on the local disk to keep the cached
+        mileages in across restarts, or None to keep them in memory only.
+        'maxSize' is the maximum number of zip pairs to remember, and
+        'saveInterval' is how often (in seconds) to save the cache to disk
+        if it has changed.
+
+        The cache is reloaded from the given file.  This should be called
+        once, at startup, before any mileages are looked up.
+    """
+    global _mileageCache
+    global MILEAGE_CACHE_FILE, MILEAGE_CACHE_SIZE, MILEAGE_CACHE_SAVE_INTERVAL
+
+    _mileageCache.stopPeriodicSaving()
+    _mileageCache.save()
+
+    MILEAGE_CACHE_FILE          = path
+    MILEAGE_CACHE_SIZE          = maxSize
+    MILEAGE_CACHE_SAVE_INTERVAL = saveInterval
+
+    _mileageCache = MileageCache.MileageCache(maxSize=maxSize, path=path)
+    if path != None:
+        _mileageCache.startPeriodicSaving(saveInterval)
+
+
+def saveMileageCache():
+    """ Write the mileage cache to MILEAGE_CACHE_FILE now, if it has changed.
+
+        This is also done automatically when the program exits.
+    """
+    _mileageCache.save()
+
+atexit.register(saveMileageCache)
+
+
+def getMileageCacheStats():
+    """ Return the hit/miss statistics for our mileage cache.
+    """
+    return _mileageCache.getStats()
+
+
+def setMileageDebounceDelay(delay):
+    """ Set how long to wait, in seconds, after the last zip code change
+        before calculating the mileage.
+    """
+    global MILEAGE_DEBOUNCE_DELAY
+
+    MILEAGE_DEBOUNCE_DELAY = delay
+    _mileageWorker.setDelay(delay)
+
+
+def setDeliveryTimeTables(calendar, transitTable):
+    """ Set the tables used to calculate delivery times.
+
+        'calendar' should be a DeliveryTimeEngine.BusinessCalendar, and
+        'transitTable' a DeliveryTimeEngine.TransitTable.  These should be
+        loaded once, at startup, so that no database access is needed while
+        the delivery times are being recalculated.
+    """
+    _deliveryTimeEngine.calendar     = calendar
+    _deliveryTimeEngine.transitTable = transitTable
+
+
+def prefetchCustomers(customerIds=None):
+    """ Load the POD attributes for several customers in one bulk query.
+
+        If 'customerIds' is None, every customer is loaded.
+    """
+    _customerCache.prefetch(customerIds)
+
+
+def invalidateCustomer(customer=None):
+    """ Throw away our cached attributes for the given customer.
+
+        This must be called whenever a Customer record is edited.  If
+        'customer' is None, all the cached customer attributes are thrown
+        away.
+    """
+    _customerCache.invalidate(customer)
+
+
+def getCustomerCacheStats():
+    """ Return statistics for our customer cache, including the number of
+        database selects it has avoided.
+    """
+    return _customerCache.getStats()
 
 #############################################################################
 
 class SubPanel(InputPanel):
     """Create a SubPanel
+
+    The SubPanel's input fields are defined by a list of FieldSpec and
+    VerticalGap objects.  The input fields aren't created until build() is
+    called; until then, the field values are kept in a dictionary.
     """
-    def __init__(self, parent, editor, showRoundTripField=False):
+    def __init__(self, parent, editor, showRoundTripField=False, spec=[]):
         """
         :param parent:
         :param editor:
         :param showRoundTripField:
+        :param spec: the FieldSpec and VerticalGap objects defining our fields.
         :return:
         """
         InputPanel.__init__(self, parent)
         self._editor = editor
+        self._showRoundTripField = showRoundTripField
+        self._roundTrip   = False
+        self._spec        = spec
+        self._built       = False
+        self._fieldKeys   = [] # Record keys for our fields, in tab order.
+        self._fieldsByKey = {} # Maps record key -> input field, once built.
+        self._values      = {} # Maps record key -> value, until built.
+
+        for entry in spec:
+            if isinstance(entry, DetailsFields.FieldSpec):
+                self._fieldKeys.append(entry.key)
+
+        self.layout()
+
+    def build(self):
+        """ Create and lay out our input fields, if we haven't already.
+
+            Any field values set before we were built are copied into the
+            newly-created fields.
+        """
+        if self._built:
+            return
+
+        for entry in self._spec:
+            if isinstance(entry, DetailsFields.VerticalGap):
+                self.addVerticalGap(entry.height)
+                continue
+
+            kwargs = {}
+            if entry.displayWidth != None:
+                kwargs['displayWidth'] = entry.displayWidth
+            if entry.editWidth != None:
+                kwargs['editWidth'] = entry.editWidth
+
+            fieldClass = getattr(Editor, entry.fieldClass)
+            if entry.text != None:
+                field = fieldClass(self, entry.text, **kwargs)
+            else:
+                field = fieldClass(self, **kwargs)
+            if entry.readOnly:
+                field.setReadOnly()
+
+            setattr(self, entry.attrName, field)
+            self.addField(entry.label, field, entry.key)
 
         self.layout()
+        self._built = True
+
+        for key,value in self._values.items():
+            self._fieldsByKey[key].setValue(value)
+        self._values = {}
+
+    def isBuilt(self):
+        """ Return True if our input fields have been created.
+        """
+        return self._built
+
+    def hasField(self, key):
+        """ Return True if we have an input field for the given record key.
+        """
+        return key in self._fieldKeys
+
+    def addField(self, label, field, key):
+        """ Override InputPanel.addField().
+
+            We keep track of which input field displays each record key, so
+            that loadRecord() can update the fields directly.
+        """
+        InputPanel.addField(self, label, field, key)
+        if key != None:
+            self._fieldsByKey[key] = field
+
+    def getValue(self, key):
+        """ Return the current value for the given record key.
+        """
+        if self._built:
+            return self._fieldsByKey[key].getValue()
+        else:
+            return self._values.get(key)
+
+    def setValue(self, key, value):
+        """ Set the value for the given record key.
+
+            If our input fields haven't been created yet, the value is
+            remembered until they are.
+        """
+        if self._built:
+            self._fieldsByKey[key].setValue(value)
+        else:
+            self._values[key] = value
+
+    def loadRecord(self, rec):
+        """ Copy the given record into our fields, skipping unchanged values.
+
+            Unlike recordToPanel(), we only call setValue() for the fields
+            whose displayed value differs from the record's value, so that
+            unchanged fields aren't repainted and don't notify any listeners.
+        """
+        for key in self._fieldKeys:
+            value = rec.get(key)
+            if self.getValue(key) != value:
+                self.setValue(key, value)
+
+    def copyToRecord(self, rec):
+        """ Copy the values of our fields into the given record.
+        """
+        if self._built:
+            InputPanel.panelToRecord(self, rec)
+        else:
+            for key in self._fieldKeys:
+                rec[key] = self._values.get(key)
 
     def recordToPanel(self, rec):
         """ Override InputPanel.recordToPanel().
@@ -127,19 +444,11 @@ class SubPanel(InputPanel):
 
     def _onCustomerChanged(self, customer):
         """ Respond to the customer value changing.
-        """
-        if customer in [-1, None]:
-            results = []
-        else:
-            results = Database.select("Customer", ["jobRequiresPODWithEmailBack",
-                                                   "jobRequiresPOD",
-                                                   "jobRequiresPODWithCallBack"],
-                                      "id="+str(customer))
 
-        if len(results) == 1:
-            cust = results[0]
-        else:
-            cust = {}
+            The customer's POD attributes come from our customer cache, so
+            this normally doesn't need to access the database.
+        """
+        cust = _customerCache.get(customer)
 
         if cust.get("jobRequiresPODWithEmailBack") == "true":
             jobRequiresPODWithEmailBack = True
@@ -154,9 +463,9 @@ class SubPanel(InputPanel):
         else:
             jobRequiresPODWithCallBack = False
 
-        self._requiresPODWithEmailBackField.setValue(jobRequiresPODWithEmailBack)
-        self._requiresPODField.setValue(jobRequiresPOD)
-        self._requiresPODWithCallBackField.setValue(jobRequiresPODWithCallBack)
+        self.setValue("requiresPODWithEmailBack", jobRequiresPODWithEmailBack)
+        self.setValue("requiresPOD",              jobRequiresPOD)
+        self.setValue("requiresPODWithCallBack",  jobRequiresPODWithCallBack)
 
 
 class DetailsPanel(InputPanel):
@@ -172,13 +481,33 @@ class DetailsPanel(InputPanel):
 
         InputPanel.__init__(self, parent)
 
+        # Load the attributes of all our customers in one go, the first time
+        # a DetailsPanel is created.
+        _customerCache.warm()
+
         self._editor = editor
         self._showRoundTripField = showRoundTripField
         self._origPickupZipCode  = None
         self._origDropoffZipCode = None
+        self._mileagePending     = False
+        self._pendingZipCodes    = (None, None)
+        self._batchDepth         = 0
+        self._deferredListeners  = OrderedDict() # Maps field -> (callback, value).
+        self._cleanValues        = {} # Field values as of the last load/save.
+        self._fieldListeners     = [] # List of (field, listener) tuples.
+        self._changedZipCodes    = {} # Maps zip code field -> new value.
+        self._zipChangeQueued    = False
+        self._deliveryTimes      = DeliveryTimeEngine.DeliveryTimeState(_deliveryTimeEngine)
+
+        if showRoundTripField:
+            timeFields = (DetailsFields.TIME_PANEL_FIELDS +
+                          [DetailsFields.ROUND_TRIP_FIELD])
+        else:
+            timeFields = DetailsFields.TIME_PANEL_FIELDS
 
-        self._pricePan = SubPanel(self, parent)
-        self._timePan  = SubPanel(self, parent)
+        self._pricePan = SubPanel(self, editor, spec=DetailsFields.PRICE_PANEL_FIELDS)
+        self._timePan  = SubPanel(self, editor, showRoundTripField,
+                                  spec=timeFields)
 
         # Add panels next to each other in the same row
         self.startRow()
@@ -186,190 +515,54 @@ class DetailsPanel(InputPanel):
         self.addField(None, self._pricePan, None)
         self.endRow()
 
-        ##################### Define input fields for _timePan #####################
-        #
-        #  Note: this ordering is REQUIRED to TAB properly from one field to the next
-        #
-        self._timePan._recipientsNameField           = TextInputField(self._timePan,
-                                                                      displayWidth=15, editWidth=32)
-        self._timePan._prebookedField                = BooleanInputField(self._timePan,
-                                                                         "Prebooked Job")
-        self._timePan._readyAtField                  = DateTimeInputField(self._timePan)
-        self._timePan._deliverByField                = DateTimeInputField(self._timePan)
-        self._timePan._timeEnteredField              = DateTimeInputField(self._timePan)
-        self._timePan._timeAcknowledgedField         = DateTimeInputField(self._timePan)
-        self._timePan._timePickedUpField             = DateTimeInputField(self._timePan)
-        self._timePan._calcDeliveryTimeField         = DateTimeInputField(self._timePan)
-        self._timePan._calcDeliveryTimeField.setReadOnly()
-        self._timePan._hasDeliveryTimeOverrideField  = BooleanInputField(self._timePan,
-                                                                         "Has Delivery Time Override")
-        self._timePan._deliveryTimeOverrideField     = DateTimeInputField(self._timePan)
-        self._timePan._actualDeliveryTimeField       = DateTimeInputField(self._timePan)
-        self._timePan._actualDeliveryTimeField.setReadOnly()
-        self._timePan._lateJobExemptField            = BooleanInputField(self._timePan,
-                                                                         "Late Job Exempt")
-        self._timePan._okayToLeaveField              = BooleanInputField(self._timePan,
-                                                                         "OK To Leave")
-        self._timePan._requiresPODField              = BooleanInputField(self._timePan,
-                                                                         "Requires POD")
-        self._timePan._requiresPODWithCallBackField  = BooleanInputField(self._timePan,
-                                                                         "Requires POD with Call Back")
-        self._timePan._requiresPODWithEmailBackField = BooleanInputField(self._timePan,
-                                                                         "Requires POD with Email Back")
-        if showRoundTripField:
-            self._timePan._roundTripField            = BooleanInputField(self._timePan,
-                                                                         "Round Trip Job")
-        else:
-            # Keep track of this value internally.
-            self._timePan._roundTrip = False
-
-        # self._suppressDataMessageField = BooleanInputField(self._timePan,
-        #                                                    "Suppress Data Message")
-        # self._timePan._dateForBillingField           = DateTimeInputField(self._timepan,
-        #                                                                   useTime=False)
-
-        ##################### Define input fields for _pricePan #####################
-        #
-        #  Note: this ordering is REQUIRED to Tab properly from one field to the next
-        #
-        self._pricePan._mileageField              = FloatInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._mileageField.setReadOnly()
-        self._pricePan._basePriceField            = MoneyInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._basePriceField.setReadOnly()
-        self._pricePan._priceModifierField        = MoneyInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._priceModifierField.setReadOnly()
-        self._pricePan._calculatedPriceField      = MoneyInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._calculatedPriceField.setReadOnly()
-        self._pricePan._defaultStandardPriceField = MoneyInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._defaultStandardPriceField.setReadOnly()
-        self._pricePan._hasPriceOverrideField     = BooleanInputField(self._pricePan,
-                                                                  "Has Price Override")
-        self._pricePan._priceOverrideField        = MoneyInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._actualPriceField          = MoneyInputField(self._pricePan, editWidth=12,
-                                                                    displayWidth=12)
-        self._pricePan._actualPriceField.setReadOnly()
-
-        ##################### Layout _timePan contents #####################
-        self._timePan.addField("Recipient's Name",         self._timePan._recipientsNameField,
-                               "recipientsName")
-        # ------------------------------
-        self._timePan.addVerticalGap(5)
-        # ------------------------------
-        self._timePan.addField(None,                       self._timePan._prebookedField,
-                               "isPrebooked")
-        # self._timePan.addField("Ready At",                self._readyAtField,
-        #                      "timeEntered")
-        self._timePan.addField("Ready At",                 self._timePan._readyAtField,
-                               "readyAt")
-        self._timePan.addField("Deliver By",               self._timePan._deliverByField,
-                               "deliverBy")
-        # ------------------------------
-        self._timePan.addVerticalGap(5)
-        # ------------------------------
-        self._timePan.addField("Time Entered",             self._timePan._timeEnteredField,
-                               "timeEntered")
-        self._timePan.addField("Time Acknowledged",        self._timePan._timeAcknowledgedField,
-                               "timeAcknowledged")
-        self._timePan.addField("Time Picked Up",           self._timePan._timePickedUpField,
-                               "timePickedUp")
-        # ------------------------------
-        self._timePan.addVerticalGap(5)
-        # ------------------------------
-        self._timePan.addField("Calculated Delivery Time", self._timePan._calcDeliveryTimeField,
-                               "calculatedDeliveryTime")
-        self._timePan.addField(None,                       self._timePan._hasDeliveryTimeOverrideField,
-                               "hasDeliveryTimeOverride")
-        self._timePan.addField("Delivery Time Override",   self._timePan._deliveryTimeOverrideField,
-                               "deliveryTimeOverride")
-        self._timePan.addField("Actual Delivery Time",     self._timePan._actualDeliveryTimeField,
-                               "actualDeliveryTime")
-        self._timePan.addField(None, self._timePan._lateJobExemptField, "lateJobExempt")
-
-        # ------------------------------
-        self._timePan.addVerticalGap(5)
-        # ------------------------------
-        self._timePan.addField(None,                       self._timePan._okayToLeaveField,
-                               "okayToLeave")
-        self._timePan.addField(None,                       self._timePan._requiresPODField,
-                               "requiresPOD")
-        self._timePan.addField(None,                       self._timePan._requiresPODWithCallBackField,
-                               "requiresPODWithCallBack")
-        self._timePan.addField(None,                       self._timePan._requiresPODWithEmailBackField,
-                               "requiresPODWithEmailBack")
-
-        if showRoundTripField:
-            self._timePan.addField(None, self._timePan._roundTripField, "roundTrip")
-
-        # self._timePan.addField(None, self._suppressDataMessageField,
-        #              "suppressDataMessage")
-
-        self._timePan.layout()
-
-        ##################### Layout _pricePan contents #####################
-        self._pricePan.addField("Mileage",                  self._pricePan._mileageField,
-                                "mileage")
-        # ------------------------------
-        self._pricePan.addVerticalGap(10)
-        # ------------------------------
-        self._pricePan.addField("Price",                    self._pricePan._basePriceField,
-                                "basePrice")
-        self._pricePan.addField("Price Modifier",           self._pricePan._priceModifierField,
-                                "priceModifier")
-        self._pricePan.addField("Calculated Price",         self._pricePan._calculatedPriceField,
-                                "calculatedPrice")
-        self._pricePan.addField("DBC Standard Price ",      self._pricePan._defaultStandardPriceField,
-                                "defaultStandardBasePrice")
-        # ------------------------------
-        self._pricePan.addVerticalGap(5)
-        # ------------------------------
-        self._pricePan.addField(None,                       self._pricePan._hasPriceOverrideField,
-                                "hasPriceOverride")
-        self._pricePan.addField("Price Override",           self._pricePan._priceOverrideField,
-                                "priceOverride")
-        # ------------------------------
-        self._pricePan.addVerticalGap(10)
-        # ------------------------------
-        self._pricePan.addField("Actual Price To Customer", self._pricePan._actualPriceField,
-                                "actualPrice")
-        self._pricePan.layout()
+        # The input fields within our sub-panels are defined by the field
+        # specs, above, and aren't created until this panel is first shown.
+        # Until then, the sub-panels keep track of the field values
+        # internally.
 
+        self.Bind(wx.EVT_SHOW, self._onShow)
+        wx.CallAfter(self._buildIfShown)
 
         # Prepare to catch the field value changes we want to respond to at the
         # input panel level.
 
-        editor.registerFieldListener("pickupZipCode", self._onPickupZipChanged)
-        editor.registerFieldListener("dropoffZipCode",
-                                                     self._onDropoffZipChanged)
-        editor.registerFieldListener("customer", self._onCustomerChanged)
+        self._registerFieldListeners()
 
         self.layout()
 
-        # TODO: add support for recalculating actual times as values are
-        # entered.
-
-
-
 
     def recordToPanel(self, rec):
         """ Override InputPanel.recordToPanel().
 
             If we are not showing the "round trip" field, we keep track of this
             value internally.
-        """
-        ##Price Panel##
-        self._origPickupZipCode  = rec.get("pickupZipCode")
-        self._origDropoffZipCode = rec.get("dropoffZipCode")
 
-        ## Options Panel ##
-        InputPanel.recordToPanel(self, rec)
-        if not self._showRoundTripField:
-            self._timePan._roundTrip = rec.get("roundTrip", False)
+            The record is loaded as a batch (see beginBatch()), and only the
+            fields whose value has changed are updated.
+        """
+        with _latency.timed("DetailsPanel.recordToPanel"):
+            # Anything still pending belongs to the previous job.
+            self._cancelPendingWork()
+
+            self.beginBatch()
+            try:
+                ##Price Panel##
+                self._origPickupZipCode  = rec.get("pickupZipCode")
+                self._origDropoffZipCode = rec.get("dropoffZipCode")
+                self._pricePan.loadRecord(rec)
+
+                ## Options Panel ##
+                self._timePan.loadRecord(rec)
+                if not self._showRoundTripField:
+                    self._timePan._roundTrip = rec.get("roundTrip", False)
+                self._deliveryTimes.load(rec)
+
+                # Remember the loaded values, so we can tell which ones
+                # change.  Note that we do this before running any deferred
+                # listeners, as changes made by the listeners need to be saved.
+                self.markClean()
+            finally:
+                self.endBatch()
 
 
     def panelToRecord(self, rec):
@@ -378,15 +571,52 @@ class DetailsPanel(InputPanel):
             If we are not showing the "round trip" field, we keep track of this
             value internally.
         """
-        ##Price Panel##
-        self._origPickupZipCode  = rec.get("pickupZipCode")
-        self._origDropoffZipCode = rec.get("dropoffZipCode")
+        with _latency.timed("DetailsPanel.panelToRecord"):
+            ##Price Panel##
+            self._origPickupZipCode  = rec.get("pickupZipCode")
+            self._origDropoffZipCode = rec.get("dropoffZipCode")
 
-        InputPanel.panelToRecord(self._pricePan, rec)
-        InputPanel.panelToRecord(self._timePan, rec) #EHH?
+            self._copyFieldsToRecord(rec)
 
-        if not self._showRoundTripField:
-            rec['roundTrip'] = self._timePan._roundTrip
+
+    def panelToDelta(self):
+        """ Return the fields which have changed since the record was loaded.
+
+            We return a dictionary mapping each record key whose value differs
+            from the value passed to the last call to recordToPanel() (or
+            markClean()) to its new value.  The dictionary is empty if nothing
+            has changed, in which case the editor doesn't need to save the
+            record at all.
+
+            This only reads the current field values: a queued zip code
+            change or pending mileage calculation is left to finish in its own
+            time, so a pending mileage shows up as its displayed value.
+        """
+        values = {}
+        self._readFieldsIntoRecord(values)
+
+        delta = {}
+        for key,value in values.items():
+            if key not in self._cleanValues or self._cleanValues[key] != value:
+                delta[key] = value
+        return delta
+
+
+    def isDirty(self):
+        """ Return True if any field has changed since the record was loaded.
+        """
+        return len(self.panelToDelta()) > 0
+
+
+    def markClean(self):
+        """ Treat the current field values as unchanged.
+
+            This should be called once the editor has saved the record, so
+            that subsequent calls to panelToDelta() only return the fields
+            changed since the save.
+        """
+        self._cleanValues = {}
+        self._readFieldsIntoRecord(self._cleanValues)
 
 
     def setFieldValue(self, field, value):
@@ -397,30 +627,218 @@ class DetailsPanel(InputPanel):
         """
         if not self._showRoundTripField and field == "roundTrip":
             self._timePan._roundTrip = value
+        elif self._timePan.hasField(field):
+            self._timePan.setValue(field, value)
+        elif self._pricePan.hasField(field):
+            self._pricePan.setValue(field, value)
         else:
             InputPanel.setFieldValue(self, field, value)
 
+    def detach(self):
+        """ Detach this panel from its editor, so that it can be reused.
+
+            Our field listeners are unregistered, and any pending mileage
+            calculation is abandoned.  The panel is hidden; call rebind() to
+            attach it to another editor.
+        """
+        self._cancelPendingWork()
+
+        # Note that this relies on the editor providing
+        # unregisterFieldListener() to undo registerFieldListener().
+        for fieldName,listener in self._fieldListeners:
+            self._editor.unregisterFieldListener(fieldName, listener)
+        self._fieldListeners = []
+
+        # Abandon any batch in progress, without running its deferred
+        # listeners.  The panel was frozen when the batch started, so it must
+        # be thawed or it will never repaint once it is reused.
+        self._deferredListeners.clear()
+        if self._batchDepth > 0:
+            self._batchDepth = 0
+            self.Thaw()
+        self.Hide()
+
+    def rebind(self, parent, editor):
+        """ Attach a detached panel to the given parent window and editor.
+
+            The editor should then call recordToPanel() to load the new job.
+            As recordToPanel() only updates the fields whose values differ,
+            fields which are the same as for the previous job aren't touched.
+        """
+        self.Reparent(parent)
+        self._editor           = editor
+        self._pricePan._editor = editor
+        self._timePan._editor  = editor
+
+        self._origPickupZipCode  = None
+        self._origDropoffZipCode = None
+        self._pendingZipCodes    = (None, None)
+        self._cleanValues        = {}
+
+        self._registerFieldListeners()
+        self.Show()
+
+    def getShowRoundTripField(self):
+        """ Return True if this panel shows the "round trip" field.
+        """
+        return self._showRoundTripField
+
+    def buildFields(self):
+        """ Create the input fields within our sub-panels, if we haven't
+            already.
+
+            This happens automatically when the panel is first shown.
+        """
+        if self._timePan.isBuilt() and self._pricePan.isBuilt():
+            return
+
+        self.Freeze()
+        try:
+            self._timePan.build()
+            self._pricePan.build()
+            self.layout()
+        finally:
+            self.Thaw()
+
+    def beginBatch(self):
+        """ Start a batch of changes to this panel.
+
+            Until the matching call to endBatch(), the panel is frozen so
+            that it isn't repainted, and the field listeners we have
+            registered with the editor are deferred rather than being run.
+            The editor can wrap the loading of a whole record in
+            beginBatch()/endBatch() so that our listeners don't respond to
+            the other panels' fields before the record has been fully loaded.
+
+            Batches can be nested.
+        """
+        self._batchDepth = self._batchDepth + 1
+        if self._batchDepth == 1:
+            self.Freeze()
+
+    def endBatch(self):
+        """ Finish a batch of changes to this panel.
+
+            When the outermost batch ends, each deferred field listener is run
+            once, with the latest value for its field, and then the panel is
+            thawed.
+        """
+        if self._batchDepth == 0:
+            return
+        if self._batchDepth > 1:
+            self._batchDepth = self._batchDepth - 1
+            return
+
+        try:
+            while len(self._deferredListeners) > 0:
+                fieldName,(callback, value) = self._deferredListeners.popitem(last=False)
+                callback(value)
+        finally:
+            self._batchDepth = 0
+            self._deferredListeners.clear()
+            self.Thaw()
+
+    def isMileagePending(self):
+        """ Return True if we are still calculating the mileage for this job.
+        """
+        return self._mileagePending
+
+    def declareLookups(self, rec, plan):
+        """ Declare the lookups we will need to load the given record.
+
+            'plan' is the LoadPlan for loading the record.  We declare the
+            job's customer, so that its POD attributes are loaded into our
+            customer cache, and the job's zip pair, so that an uncached
+            mileage starts being calculated in the background straight away.
+            Once the plan has been executed, our customer listener finds
+            everything it needs in memory, and the mileage is either known or
+            shown as pending until its calculation finishes.
+        """
+        plan.declare("customer", rec.get("customer"), _resolveCustomers)
+
+        pickupZipCode  = rec.get("pickupZipCode")
+        dropoffZipCode = rec.get("dropoffZipCode")
+        if pickupZipCode != None and dropoffZipCode != None:
+            plan.declare("mileage", (pickupZipCode, dropoffZipCode),
+                         _resolveMileages)
+
+    def _cancelPendingWork(self):
+        """ Abandon any queued zip code change and pending mileage
+            calculation.
+
+            A background result for the abandoned calculation is never
+            delivered to this panel.
+        """
+        _mileageWorker.cancel(id(self))
+        self._mileagePending  = False
+        self._pendingZipCodes = (None, None)
+        self._changedZipCodes = {}
+        self._zipChangeQueued = False
+
     def _onPickupZipChanged(self, pickupZipCode):
         """ Respond to the user changing the pickup zip code.
 
-            We recalculate the mileage based on our new information.
+            We recalculate the mileage based on our new information.  Note
+            that the recalculation is coalesced with any other zip code
+            changes made during the same event-loop turn; see
+            _onZipCodesChanged().
         """
-        dropoffZipCode = self._editor.getFieldValue("dropoffZipCode")
-        if dropoffZipCode in [-1, None]:
-            # The dropoff zip code hasn't changed -> use original value.
-            dropoffZipCode = self._origDropoffZipCode
-
-        self._calcMileage(pickupZipCode, dropoffZipCode)
+        self._changedZipCodes["pickupZipCode"] = pickupZipCode
+        self._scheduleZipCodesChanged()
 
     def _onDropoffZipChanged(self, dropoffZipCode):
         """ Respond to the user changing the dropoff zip code.
 
-            We recalculate the mileage based on our new information.
+            We recalculate the mileage based on our new information.  Note
+            that the recalculation is coalesced with any other zip code
+            changes made during the same event-loop turn; see
+            _onZipCodesChanged().
+        """
+        self._changedZipCodes["dropoffZipCode"] = dropoffZipCode
+        self._scheduleZipCodesChanged()
+
+    def _scheduleZipCodesChanged(self):
+        """ Arrange for _onZipCodesChanged() to be called once the current
+            event has been processed.
+        """
+        if not self._zipChangeQueued:
+            self._zipChangeQueued = True
+            wx.CallAfter(self._onZipCodesChanged)
+
+    def _onZipCodesChanged(self):
+        """ Respond to the pickup and/or dropoff zip codes being changed.
+
+            When an address is pasted or a saved route is applied, both zip
+            codes change together.  Rather than recalculating the mileage
+            (and telling the editor about it) once for each change, using a
+            stale value for the other zip code the first time, we wait until
+            the end of the event-loop turn and recalculate the mileage once,
+            using the latest value for both zip codes.
         """
-        pickupZipCode = self._editor.getFieldValue("pickupZipCode")
-        if pickupZipCode in [-1, None]:
-            # The pickup zip code hasn't changed -> use original value.
-            pickupZipCode = self._origPickupZipCode
+        if not self:
+            return # This panel has been destroyed.
+
+        self._zipChangeQueued = False
+        changed = self._changedZipCodes
+        self._changedZipCodes = {}
+        if len(changed) == 0:
+            return
+
+        if "pickupZipCode" in changed:
+            pickupZipCode = changed["pickupZipCode"]
+        else:
+            pickupZipCode = self._editor.getFieldValue("pickupZipCode")
+            if pickupZipCode in [-1, None]:
+                # The pickup zip code hasn't changed -> use original value.
+                pickupZipCode = self._origPickupZipCode
+
+        if "dropoffZipCode" in changed:
+            dropoffZipCode = changed["dropoffZipCode"]
+        else:
+            dropoffZipCode = self._editor.getFieldValue("dropoffZipCode")
+            if dropoffZipCode in [-1, None]:
+                # The dropoff zip code hasn't changed -> use original value.
+                dropoffZipCode = self._origDropoffZipCode
 
         self._calcMileage(pickupZipCode, dropoffZipCode)
 
@@ -428,21 +846,85 @@ class DetailsPanel(InputPanel):
     # == PRIVATE METHODS ==
     # =====================
 
+    def _onShow(self, event):
+        """ Respond to our panel being shown or hidden.
+        """
+        event.Skip()
+        self._buildIfShown()
+
+    def _buildIfShown(self):
+        """ Create our input fields if our panel is visible on the screen.
+        """
+        if not self:
+            return # This panel has been destroyed.
+        if self.IsShownOnScreen():
+            self.buildFields()
+
+    def _copyFieldsToRecord(self, rec):
+        """ Copy the values of our fields into the given record, for saving.
+
+            Any queued zip code change or pending mileage calculation is
+            finished first, so the saved record has an up-to-date mileage.
+        """
+        if self._zipChangeQueued:
+            # Don't wait for the end of the event-loop turn.
+            self._onZipCodesChanged()
+
+        if self._mileagePending:
+            # Don't save a job without its mileage -> calculate it now.
+            self._finishPendingMileage()
+
+        self._readFieldsIntoRecord(rec)
+
+    def _readFieldsIntoRecord(self, rec):
+        """ Copy the current values of our fields into the given record.
+
+            Unlike _copyFieldsToRecord(), this has no side effects.
+        """
+        self._pricePan.copyToRecord(rec)
+        self._timePan.copyToRecord(rec)
+
+        if not self._showRoundTripField:
+            rec['roundTrip'] = self._timePan._roundTrip
+
+    def _registerFieldListeners(self):
+        """ Register the field listeners we need with our editor.
+        """
+        self._addFieldListener("pickupZipCode",  self._onPickupZipChanged)
+        self._addFieldListener("dropoffZipCode", self._onDropoffZipChanged)
+        self._addFieldListener("customer",       self._onCustomerChanged)
+
+        for fieldName in DeliveryTimeEngine.INPUT_FIELDS:
+            self._addFieldListener(fieldName,
+                                   self._makeDeliveryTimeListener(fieldName))
+
+    def _addFieldListener(self, fieldName, callback):
+        """ Register a listener for the given field with our editor.
+
+            The listener is wrapped so that it is deferred while a batch of
+            changes is in progress (see beginBatch()), and so that the time it
+            takes is recorded when latency profiling is enabled.
+        """
+        callback = _latency.wrap("listener." + fieldName, callback)
+
+        def listener(value):
+            if self._batchDepth > 0:
+                if fieldName in self._deferredListeners:
+                    del self._deferredListeners[fieldName]
+                self._deferredListeners[fieldName] = (callback, value)
+            else:
+                callback(value)
+
+        self._editor.registerFieldListener(fieldName, listener)
+        self._fieldListeners.append((fieldName, listener))
+
     def _onCustomerChanged(self, customer):
         """ Respond to the customer value changing.
-        """
-        if customer in [-1, None]:
-            results = []
-        else:
-            results = Database.select("Customer", ["jobRequiresPODWithEmailBack",
-                                                   "jobRequiresPOD",
-                                                   "jobRequiresPODWithCallBack"],
-                                      "id="+str(customer))
 
-        if len(results) == 1:
-            cust = results[0]
-        else:
-            cust = {}
+            The customer's POD attributes come from our customer cache, so
+            this normally doesn't need to access the database.
+        """
+        cust = _customerCache.get(customer)
 
         if cust.get("jobRequiresPODWithEmailBack") == "true":
             jobRequiresPODWithEmailBack = True
@@ -457,18 +939,400 @@ class DetailsPanel(InputPanel):
         else:
             jobRequiresPODWithCallBack = False
 
-        self._timePan._requiresPODWithEmailBackField.setValue(jobRequiresPODWithEmailBack)
-        self._timePan._requiresPODField.setValue(jobRequiresPOD)
-        self._timePan._requiresPODWithCallBackField.setValue(jobRequiresPODWithCallBack)
+        self._timePan.setValue("requiresPODWithEmailBack", jobRequiresPODWithEmailBack)
+        self._timePan.setValue("requiresPOD",              jobRequiresPOD)
+        self._timePan.setValue("requiresPODWithCallBack",  jobRequiresPODWithCallBack)
+
+    def _makeDeliveryTimeListener(self, fieldName):
+        """ Return a listener for changes to the given delivery time input.
+        """
+        def _onDeliveryTimeInputChanged(value):
+            self._updateDeliveryTimes(fieldName, value)
+        return _onDeliveryTimeInputChanged
+
+    def _updateDeliveryTimes(self, fieldName, value):
+        """ Respond to one of the delivery time inputs changing.
+
+            Only the delivery times which depend on the changed field are
+            recalculated; any which change are displayed, and the editor is
+            told about them.
+        """
+        changed = self._deliveryTimes.setInput(fieldName, value)
+        for derived in DeliveryTimeEngine.DERIVED_FIELDS:
+            if derived in changed:
+                self._timePan.setValue(derived, changed[derived])
+                self._editor.fieldChanged(derived, changed[derived])
 
     def _calcMileage(self, pickupZipCode, dropoffZipCode):
         """ Recalculate the mileage for this job.
+
+            If the mileage for this zip pair is in our cache, we use it right
+            away.  Otherwise, we show the mileage as pending and ask our
+            background worker to calculate it; any calculation still pending
+            for this panel is superseded by the new one.
         """
-        if pickupZipCode != None and dropoffZipCode != None:
-            mileage = Calculator.calculateMileage(None, None, pickupZipCode,
-                                                  None, None, dropoffZipCode)
-        else:
-            mileage = None
+        self._pendingZipCodes = (pickupZipCode, dropoffZipCode)
+
+        if pickupZipCode == None or dropoffZipCode == None:
+            _mileageWorker.cancel(id(self))
+            self._setMileage(None)
+            return
+
+        mileage = _mileageCache.get(pickupZipCode, dropoffZipCode)
+        if mileage == None:
+            # Matrix lookups are cheap, so they aren't cached.
+            mileage = _lookupMatrixMileage(pickupZipCode, dropoffZipCode)
+        if mileage != None:
+            _mileageWorker.cancel(id(self))
+            self._setMileage(mileage)
+            return
+
+        if not self._mileagePending:
+            self._mileagePending = True
+            self._pricePan.setValue("mileage", None)
+
+        _mileageWorker.submit(id(self), _calculateAndCacheMileage,
+                              (pickupZipCode, dropoffZipCode),
+                              onResult=self._onMileageCalculated,
+                              onError=self._onMileageFailed)
+
+    def _onMileageCalculated(self, mileage):
+        """ Respond to our background worker calculating the mileage.
+
+            This is called on the GUI thread, and only for the most recent
+            mileage calculation we asked for.
+        """
+        if not self:
+            return # This panel has been destroyed.
+        self._setMileage(mileage)
+
+    def _onMileageFailed(self, err):
+        """ Respond to our background worker failing to calculate the mileage.
 
-        self._pricePan._mileageField.setValue(mileage)
+            The error is logged, and the mileage is left blank.
+        """
+        _logger.error("Unable to calculate the mileage",
+                      exc_info=(type(err), err, getattr(err, "__traceback__", None)))
+        if not self:
+            return # This panel has been destroyed.
+        self._setMileage(None)
+
+    def _finishPendingMileage(self):
+        """ Calculate the pending mileage right away, rather than waiting for
+            our background worker to do it.
+        """
+        _mileageWorker.cancel(id(self))
+        pickupZipCode,dropoffZipCode = self._pendingZipCodes
+        mileage = _mileageCache.get(pickupZipCode, dropoffZipCode)
+        if mileage == None:
+            mileage = _calculateMileage(pickupZipCode, dropoffZipCode)
+        self._setMileage(mileage)
+
+    def _setMileage(self, mileage):
+        """ Display the given mileage, and tell the editor about it.
+        """
+        self._mileagePending = False
+        self._pricePan.setValue("mileage", mileage)
         self._editor.fieldChanged("mileage", mileage)
+
+#############################################################################
+
+class DetailsPanelPool(object):
+    """ A pool of detached DetailsPanels, ready to be reused.
+
+        Creating a DetailsPanel means creating all its input fields, so
+        rather than destroying a job editor's DetailsPanel when the editor is
+        closed, we keep it in this pool and give it to the next editor which
+        needs one.
+    """
+    def __init__(self, maxSize=4):
+        """ Standard initializer.
+
+            'maxSize' is the maximum number of idle panels to keep.
+        """
+        self._maxSize   = maxSize
+        self._idle      = [] # List of detached DetailsPanels.
+        self._parking   = None # Hidden frame our idle panels belong to.
+        self._created   = 0
+        self._reused    = 0
+        self._destroyed = 0
+
+
+    def acquire(self, parent, editor, showRoundTripField=False):
+        """ Return a DetailsPanel for the given parent window and editor.
+
+            We reuse an idle panel if we have one with the same
+            'showRoundTripField' setting; otherwise a new panel is created.
+        """
+        for panel in self._idle:
+            if panel.getShowRoundTripField() == showRoundTripField:
+                self._idle.remove(panel)
+                panel.rebind(parent, editor)
+                self._reused = self._reused + 1
+                return panel
+
+        self._created = self._created + 1
+        return DetailsPanel(parent, editor, showRoundTripField)
+
+
+    def release(self, panel):
+        """ Return a DetailsPanel to the pool once its editor is closed.
+
+            This must be called before the panel's parent window is
+            destroyed.  If the pool is full, the panel is destroyed instead.
+        """
+        panel.detach()
+
+        if len(self._idle) >= self._maxSize:
+            panel.Destroy()
+            self._destroyed = self._destroyed + 1
+            return
+
+        if self._parking == None:
+            self._parking = wx.Frame(None)
+        panel.Reparent(self._parking)
+        self._idle.append(panel)
+
+
+    def clear(self):
+        """ Destroy all our idle panels, and the hidden frame they belong to.
+
+            This must be called when the application exits: the hidden frame
+            is a top-level window, so while it exists the wx main loop won't
+            end.  The pool can still be used afterwards.
+        """
+        for panel in self._idle:
+            panel.Destroy()
+        self._destroyed = self._destroyed + len(self._idle)
+        self._idle      = []
+
+        if self._parking != None:
+            self._parking.Destroy()
+            self._parking = None
+
+
+    def getStats(self):
+        """ Return a dictionary with statistics about our pool usage.
+
+            The dictionary has the following entries:
+
+                'idle'      -- The number of panels waiting to be reused.
+                'created'   -- The number of panels we have created.
+                'reused'    -- The number of times a panel was reused.
+                'destroyed' -- The number of panels destroyed because the
+                               pool was full or was cleared.
+                'reuseRate' -- The fraction of acquired panels which were
+                               reused rather than created.
+        """
+        acquired = self._created + self._reused
+        if acquired > 0:
+            reuseRate = float(self._reused) / acquired
+        else:
+            reuseRate = 0.0
+        return {'idle'      : len(self._idle),
+                'created'   : self._created,
+                'reused'    : self._reused,
+                'destroyed' : self._destroyed,
+                'reuseRate' : reuseRate}
+
+#############################################################################
+
+# The maximum number of idle DetailsPanels to keep for reuse.
+
+DETAILS_PANEL_POOL_SIZE = 4
+
+_panelPool = DetailsPanelPool(maxSize=DETAILS_PANEL_POOL_SIZE)
+
+#############################################################################
+
+def acquireDetailsPanel(parent, editor, showRoundTripField=False):
+    """ Return a DetailsPanel for a job editor, reusing a pooled one if we can.
+    """
+    return _panelPool.acquire(parent, editor, showRoundTripField)
+
+
+def releaseDetailsPanel(panel):
+    """ Return a job editor's DetailsPanel to the pool when the editor closes.
+    """
+    _panelPool.release(panel)
+
+
+def getPanelPoolStats():
+    """ Return statistics about the reuse of pooled DetailsPanels.
+    """
+    return _panelPool.getStats()
+
+
+def shutdownPanelPool():
+    """ Destroy the pooled DetailsPanels.
+
+        The application must call this when it exits (eg, when its main frame
+        is closed), so that the pool's hidden frame doesn't keep the wx main
+        loop running.
+    """
+    _panelPool.clear()
+
+#############################################################################
+
+def enableLatencyProfiling(enabled=True):
+    """ Switch the recording of DetailsPanel latencies on or off.
+    """
+    _latency.enable(enabled)
+
+
+def getLatencyStats():
+    """ Return the p50/p95/p99 latencies recorded for each operation.
+
+        See LatencyStats.LatencyRecorder.getSummary() for details.
+    """
+    return _latency.getSummary()
+
+
+def dumpLatencyStats(fileName):
+    """ Write the recorded latencies to the given JSON file.
+    """
+    _latency.dump(fileName)
+
+
+def startLatencyLogging(interval=300):
+    """ Log the recorded latencies every 'interval' seconds.
+    """
+    _latency.startPeriodicLogging(interval)
+
+#############################################################################
+
+def _lookupMatrixMileage(pickupZipCode, dropoffZipCode):
+    """ Look up the mileage between the two zip codes in our distance matrix.
+
+        We return None if we don't have a distance matrix, or if either zip
+        code isn't in it.
+    """
+    global _distanceMatrix
+
+    if DISTANCE_MATRIX_NAME == None:
+        return None
+
+    if _distanceMatrix == None:
+        matrix = ZipDistanceMatrix.ZipDistanceMatrix(DISTANCE_MATRIX_NAME)
+        if not matrix.exists():
+            return None
+        _distanceMatrix = matrix
+
+    return _distanceMatrix.lookup(pickupZipCode, dropoffZipCode)
+
+
+def _calculateMileage(pickupZipCode, dropoffZipCode):
+    """ Find the mileage between the two zip codes.
+
+        This is used for zip pairs which aren't in our mileage cache.  We use
+        our distance matrix if we can, and otherwise ask the Calculator to
+        work out the mileage.  Only the Calculator's mileages are added to
+        the cache; the matrix is quick enough to consult every time, and its
+        mileages would only push the expensive ones out of the cache.
+    """
+    mileage = _lookupMatrixMileage(pickupZipCode, dropoffZipCode)
+    if mileage != None:
+        return mileage
+
+    with _latency.timed("Calculator.calculateMileage"):
+        calculator = _getShared("shared.Calculator")
+        mileage = calculator.calculateMileage(None, None, pickupZipCode,
+                                              None, None, dropoffZipCode)
+    _mileageCache.put(pickupZipCode, dropoffZipCode, mileage)
+    return mileage
+
+
+def _calculateAndCacheMileage(pickupZipCode, dropoffZipCode):
+    """ Calculate the mileage between the two zip codes, and cache it.
+
+        This is run by our background worker, off the GUI thread.  If the
+        mileage is already being prefetched for a LoadPlan, we wait for that
+        calculation rather than starting another one.  See
+        _calculateMileage() for which mileages are cached.
+    """
+    prefetch = _getMileagePrefetch(pickupZipCode, dropoffZipCode)
+    if prefetch != None:
+        return prefetch.get()
+
+    return _calculateMileage(pickupZipCode, dropoffZipCode)
+
+
+def _resolveCustomers(customerIds):
+    """ Load the POD attributes for the given customers into our customer
+        cache, using a single query.
+
+        This is the resolver for the "customer" lookups in a LoadPlan.  No
+        query is made if the customers are already cached.  We return a
+        dictionary mapping each customer ID to its attributes.
+    """
+    attributes = _customerCache.prefetch(customerIds)
+
+    results = {}
+    for customerId in customerIds:
+        results[customerId] = attributes.get(str(customerId), {})
+    return results
+
+
+def _resolveMileages(zipPairs):
+    """ Start working out the mileages for the given zip pairs.
+
+        This is the resolver for the "mileage" lookups in a LoadPlan.  We
+        return a dictionary mapping each (pickupZipCode, dropoffZipCode)
+        tuple whose mileage is already known to that mileage.
+
+        The other mileages are calculated in the background, on our prefetch
+        pool, rather than holding up the job from opening: the panel shows
+        the mileage as pending until the calculation finishes, and its own
+        background calculation waits for the prefetch rather than repeating
+        it.
+    """
+    results = {}
+    for zipPair in zipPairs:
+        mileage = _mileageCache.get(*zipPair)
+        if mileage == None:
+            mileage = _lookupMatrixMileage(*zipPair)
+        if mileage != None:
+            results[zipPair] = mileage
+        else:
+            _startMileagePrefetch(*zipPair)
+    return results
+
+
+def _getPrefetchKey(pickupZipCode, dropoffZipCode):
+    """ Return the key to use for a mileage prefetch of the given zip pair.
+    """
+    return (MileageCache.normalizeZipCode(pickupZipCode),
+            MileageCache.normalizeZipCode(dropoffZipCode))
+
+
+def _startMileagePrefetch(pickupZipCode, dropoffZipCode):
+    """ Start calculating the mileage for the given zip pair on our prefetch
+        pool, unless this is already happening.
+    """
+    global _prefetchPool
+
+    key = _getPrefetchKey(pickupZipCode, dropoffZipCode)
+
+    def prefetch():
+        try:
+            return _calculateMileage(pickupZipCode, dropoffZipCode)
+        finally:
+            with _prefetchLock:
+                del _mileagePrefetches[key]
+
+    with _prefetchLock:
+        if key in _mileagePrefetches:
+            return
+        if _prefetchPool == None:
+            _prefetchPool = ThreadPool(MILEAGE_WORKER_THREADS)
+        # The entry is added before the prefetch can finish and remove it.
+        _mileagePrefetches[key] = _prefetchPool.apply_async(prefetch)
+
+
+def _getMileagePrefetch(pickupZipCode, dropoffZipCode):
+    """ Return the AsyncResult for the mileage prefetch of the given zip pair,
+        or None if it isn't being prefetched.
+    """
+    with _prefetchLock:
+        return _mileagePrefetches.get(_getPrefetchKey(pickupZipCode,
+                                                      dropoffZipCode))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" JobRecord.py
+
+    A compact, dictionary-compatible job record.
+
+    Job records are normally plain dictionaries.  When thousands of jobs are
+    held in memory at once (eg, by the dispatch board), the overhead of a
+    dictionary per job adds up.  A JobRecord stores the fields the
+    DetailsPanel knows about in __slots__ instead, which uses far less memory
+    per job, and numeric fields are stored as floats rather than strings.
+
+    A JobRecord behaves like a dictionary: it supports rec[key], rec[key] =
+    value, rec.get(key, default), "key in rec", keys(), items() and so on, so
+    it can be passed to DetailsPanel.recordToPanel() and panelToRecord() in
+    place of a dictionary.  Keys outside of the fixed schema are allowed, and
+    are kept in a dictionary of their own.
+"""
+
+import DetailsFields
+
+#############################################################################
+
+# The job fields the DetailsPanel listens to, which aren't displayed by it.
+
+OTHER_FIELDS = ["id", "customer", "pickupStreetAddress", "pickupZone",
+                "pickupZipCode", "dropoffStreetAddress", "dropoffZone",
+                "dropoffZipCode"]
+
+# The field classes whose values are stored as floats.
+
+NUMERIC_FIELD_CLASSES = ["FloatInputField", "MoneyInputField"]
+
+#############################################################################
+
+def _makeSchema():
+    """ Return the (fields, numericFields) for our fixed schema.
+
+        'fields' is a list of all the record keys stored in slots, and
+        'numericFields' is the set of keys whose values are stored as floats.
+    """
+    fields        = list(OTHER_FIELDS)
+    numericFields = set()
+    for spec in DetailsFields.getFieldSpecs():
+        if spec.key not in fields:
+            fields.append(spec.key)
+        if spec.fieldClass in NUMERIC_FIELD_CLASSES:
+            numericFields.add(spec.key)
+    return (fields, numericFields)
+
+SCHEMA_FIELDS,NUMERIC_FIELDS = _makeSchema()
+
+_SCHEMA_SET = frozenset(SCHEMA_FIELDS)
+
+#############################################################################
+
+class JobRecord(object):
+    """ A job record with a fixed schema, stored in slots.
+    """
+    __slots__ = SCHEMA_FIELDS + ["_extra"]
+
+    def __init__(self, values=None, **kwargs):
+        """ Standard initializer.
+
+            The record's initial values can be given as a dictionary, as
+            keyword arguments, or both.
+        """
+        if values != None:
+            self.update(values)
+        if len(kwargs) > 0:
+            self.update(kwargs)
+
+
+    @classmethod
+    def fromDict(cls, rec):
+        """ Return a new JobRecord with the same contents as the given
+            dictionary.
+        """
+        return cls(rec)
+
+
+    def toDict(self):
+        """ Return the contents of this record as a plain dictionary.
+        """
+        return dict(self.items())
+
+
+    def copy(self):
+        """ Return a copy of this record.
+        """
+        return self.__class__(self)
+
+    # ==================================
+    # == DICTIONARY-COMPATIBLE METHODS ==
+    # ==================================
+
+    def __getitem__(self, key):
+        if key in _SCHEMA_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        extra = self._getExtra()
+        if extra == None or key not in extra:
+            raise KeyError(key)
+        return extra[key]
+
+
+    def __setitem__(self, key, value):
+        if key in _SCHEMA_SET:
+            if key in NUMERIC_FIELDS:
+                value = _toNumber(value)
+            setattr(self, key, value)
+        else:
+            extra = self._getExtra()
+            if extra == None:
+                extra = {}
+                self._extra = extra
+            extra[key] = value
+
+
+    def __delitem__(self, key):
+        if key in _SCHEMA_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            extra = self._getExtra()
+            if extra == None or key not in extra:
+                raise KeyError(key)
+            del extra[key]
+
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    has_key = __contains__ # Python 2.
+
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+    def __len__(self):
+        return len(self.keys())
+
+
+    def __eq__(self, other):
+        if isinstance(other, JobRecord):
+            other = other.toDict()
+        return self.toDict() == other
+
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+    def __repr__(self):
+        return "JobRecord(" + repr(self.toDict()) + ")"
+
+
+    def __getstate__(self):
+        return self.toDict()
+
+
+    def __setstate__(self, state):
+        self.update(state)
+
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return self[key]
+
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if len(default) > 0:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+
+    def keys(self):
+        keys = []
+        for key in SCHEMA_FIELDS:
+            try:
+                getattr(self, key)
+            except AttributeError:
+                continue
+            keys.append(key)
+        extra = self._getExtra()
+        if extra != None:
+            keys.extend(extra.keys())
+        return keys
+
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+
+    def update(self, other=None, **kwargs):
+        if other != None:
+            if hasattr(other, "keys"):
+                for key in other.keys():
+                    self[key] = other[key]
+            else:
+                for key,value in other:
+                    self[key] = value
+        for key,value in kwargs.items():
+            self[key] = value
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _getExtra(self):
+        """ Return our dictionary of non-schema values, or None.
+        """
+        try:
+            return self._extra
+        except AttributeError:
+            return None
+
+#############################################################################
+
+def _toNumber(value):
+    """ Convert the given numeric field value to a float, where possible.
+
+        Only integers and numeric strings are converted.  Anything else --
+        missing values (None), floats, Decimals and values which aren't
+        numbers -- is left alone, so that no precision is lost.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return value
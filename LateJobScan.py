@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" LateJobScan.py
+
+    A batch scan of the job table for late jobs.
+
+    For each job delivered within a range of dates, we work out whether the
+    job was late, on time or exempt from the late job rules, and by how many
+    minutes it was late.  The same rules are used as in the DetailsPanel:
+
+        - The job's delivery time is its delivery time override if it has
+          one, and its actual delivery time otherwise.  This is worked out
+          in the same way as DeliveryTimeEngine.getActualDeliveryTime().
+
+        - A job is late if its delivery time is after its "deliver by" time,
+          unless it is marked as exempt from the late job rules.
+
+    Rather than looking at one job at a time, the jobs are loaded from the
+    database a day at a time (or however many days are asked for), the
+    relevant columns are converted into NumPy arrays, and every job in the
+    chunk is classified at once.  The results are returned one chunk at a
+    time, so the whole date range never needs to be held in memory.
+
+    Example:
+
+        for chunk in scanLateJobs(Database.select, startDate, endDate):
+            for jobId,minutes in zip(chunk['id'][chunk['status'] == LATE],
+                                     chunk['latenessMinutes'][chunk['status'] == LATE]):
+                ...
+
+    This module doesn't use wx.
+"""
+
+import datetime
+
+import DeliveryTimeEngine
+
+#############################################################################
+
+# The status values we assign to each job.
+
+ON_TIME = 0 # Delivered on or before the "deliver by" time.
+LATE    = 1 # Delivered after the "deliver by" time.
+EXEMPT  = 2 # Exempt from the late job rules.
+UNKNOWN = 3 # No delivery time or "deliver by" time to go on.
+
+STATUS_NAMES = {ON_TIME : "on time",
+                LATE    : "late",
+                EXEMPT  : "exempt",
+                UNKNOWN : "unknown"}
+
+# The job columns we need.
+
+COLUMNS = ["id", "deliverBy", "actualDeliveryTime", "hasDeliveryTimeOverride",
+           "deliveryTimeOverride", "lateJobExempt"]
+
+#############################################################################
+
+def scanLateJobs(select, startDate, endDate, table="Job", chunkDays=1):
+    """ Scan the jobs due between the given dates for late jobs.
+
+        'select' is the function to use to select the jobs from the database.
+        It is called as select(table, columns, where), in the same way as
+        Database.select().
+
+        'startDate' and 'endDate' are datetime.date values; we scan the jobs
+        whose "deliver by" time is on or after 'startDate' and before
+        'endDate'.  The jobs are loaded 'chunkDays' days at a time.
+
+        This is a generator, yielding one dictionary per chunk of jobs with
+        the following entries:
+
+            'startDate'       -- The first date covered by this chunk.
+            'endDate'         -- The date after the last date in this chunk.
+            'id'              -- An array of job IDs.
+            'status'          -- An array of job statuses (ON_TIME, LATE,
+                                 EXEMPT or UNKNOWN).
+            'latenessMinutes' -- An array of the number of minutes each job
+                                 was late by.  This is zero for jobs which
+                                 weren't late.
+    """
+    chunkStart = startDate
+    while chunkStart < endDate:
+        chunkEnd = min(chunkStart + datetime.timedelta(days=chunkDays), endDate)
+        where = "deliverBy >= '%s' AND deliverBy < '%s'" % \
+                    (chunkStart.strftime("%Y-%m-%d"), chunkEnd.strftime("%Y-%m-%d"))
+
+        columns = loadColumns(select(table, COLUMNS, where))
+        status,latenessMinutes = classifyJobs(columns)
+
+        yield {'startDate'       : chunkStart,
+               'endDate'         : chunkEnd,
+               'id'              : columns['id'],
+               'status'          : status,
+               'latenessMinutes' : latenessMinutes}
+
+        chunkStart = chunkEnd
+
+
+def summarize(chunks):
+    """ Return the number of jobs with each status in the given chunks.
+
+        'chunks' is the sequence of chunks returned by scanLateJobs().  We
+        return a dictionary mapping each status name (see STATUS_NAMES) to
+        the number of jobs with that status, plus a 'totalLateMinutes' entry.
+    """
+    import numpy
+
+    counts = {}
+    for name in STATUS_NAMES.values():
+        counts[name] = 0
+    counts['totalLateMinutes'] = 0
+
+    for chunk in chunks:
+        statusCounts = numpy.bincount(chunk['status'], minlength=len(STATUS_NAMES))
+        for status,name in STATUS_NAMES.items():
+            counts[name] = counts[name] + int(statusCounts[status])
+        counts['totalLateMinutes'] = counts['totalLateMinutes'] + \
+                                        int(chunk['latenessMinutes'].sum())
+    return counts
+
+#############################################################################
+
+def loadColumns(rows):
+    """ Convert a list of job rows into a dictionary of NumPy column arrays.
+
+        Date/time columns are converted to datetime64 arrays (with NaT for
+        missing values), and boolean columns to boolean arrays.
+    """
+    import numpy
+
+    def timeColumn(name):
+        values = []
+        for row in rows:
+            value = row.get(name)
+            if value in [None, ""]:
+                values.append(numpy.datetime64("NaT"))
+            else:
+                values.append(numpy.datetime64(value, "m"))
+        return numpy.array(values, dtype="datetime64[m]")
+
+    def boolColumn(name):
+        return numpy.array([DeliveryTimeEngine.isTrue(row.get(name))
+                            for row in rows], dtype=bool)
+
+    return {'id'                      : numpy.array([row.get("id") for row in rows]),
+            'deliverBy'               : timeColumn("deliverBy"),
+            'actualDeliveryTime'      : timeColumn("actualDeliveryTime"),
+            'hasDeliveryTimeOverride' : boolColumn("hasDeliveryTimeOverride"),
+            'deliveryTimeOverride'    : timeColumn("deliveryTimeOverride"),
+            'lateJobExempt'           : boolColumn("lateJobExempt")}
+
+
+def getDeliveryTimes(columns):
+    """ Return an array of the delivery time to use for each job.
+
+        This is the array form of DeliveryTimeEngine.getActualDeliveryTime():
+        the delivery time override is used for jobs which have one, and the
+        actual delivery time otherwise.
+    """
+    import numpy
+
+    useOverride = columns['hasDeliveryTimeOverride'] & \
+                  ~numpy.isnat(columns['deliveryTimeOverride'])
+    return numpy.where(useOverride, columns['deliveryTimeOverride'],
+                       columns['actualDeliveryTime'])
+
+
+def classifyJobs(columns):
+    """ Work out the status of each job in the given columns.
+
+        We return a (status, latenessMinutes) tuple of NumPy arrays; see
+        scanLateJobs() for details.
+    """
+    import numpy
+
+    deliveredAt = getDeliveryTimes(columns)
+    deliverBy   = columns['deliverBy']
+
+    known = ~numpy.isnat(deliveredAt) & ~numpy.isnat(deliverBy)
+    minutesLate = numpy.zeros(len(deliverBy), dtype=numpy.int64)
+    minutesLate[known] = (deliveredAt[known] - deliverBy[known]).astype(numpy.int64)
+
+    status = numpy.full(len(deliverBy), UNKNOWN, dtype=numpy.int8)
+    status[known & (minutesLate <= 0)] = ON_TIME
+    status[known & (minutesLate > 0)]  = LATE
+    status[columns['lateJobExempt']]   = EXEMPT
+
+    latenessMinutes = numpy.where(status == LATE, minutesLate, 0)
+    return (status, latenessMinutes)
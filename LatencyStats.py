@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" LatencyStats.py
+
+    Opt-in latency instrumentation.
+
+    A LatencyRecorder keeps a histogram of how long each named operation has
+    taken.  Code to be measured is wrapped using the recorder's timed()
+    context manager, or by wrapping a function with wrap():
+
+        with recorder.timed("Database.select"):
+            results = Database.select(...)
+
+    Each histogram uses logarithmically-spaced buckets, so the memory used is
+    fixed no matter how many times an operation is recorded, and the p50, p95
+    and p99 latencies can be reported to within about 5%.
+
+    Recording is disabled by default.  While disabled, timed() and wrap() do
+    nothing beyond calling the wrapped code, so the instrumentation can be
+    left in place in production and switched on when needed.  The collected
+    statistics can be dumped to a JSON file, or logged periodically using
+    Python's logging module.
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+
+#############################################################################
+
+# The upper bound of the first histogram bucket, in seconds, and the ratio
+# between the upper bounds of successive buckets.
+FIRST_BUCKET = 0.000001
+BUCKET_RATIO = 1.1
+
+# The largest latency we record precisely, in seconds.  Slower operations
+# are counted in the last bucket.
+MAX_LATENCY = 3600.0
+
+# The most precise timer available (time.perf_counter() is Python 3 only).
+_clock = getattr(time, "perf_counter", time.time)
+
+_NUM_BUCKETS = int(math.ceil(math.log(MAX_LATENCY / FIRST_BUCKET) /
+                             math.log(BUCKET_RATIO))) + 1
+
+#############################################################################
+
+class LatencyHistogram(object):
+    """ A histogram of the latencies recorded for a single operation.
+    """
+    def __init__(self):
+        """ Standard initializer.
+        """
+        self._buckets = [0] * _NUM_BUCKETS
+        self._count   = 0
+        self._total   = 0.0
+        self._max     = 0.0
+
+
+    def record(self, seconds):
+        """ Record a single latency, in seconds.
+        """
+        if seconds <= FIRST_BUCKET:
+            bucket = 0
+        else:
+            bucket = int(math.ceil(math.log(seconds / FIRST_BUCKET) /
+                                   math.log(BUCKET_RATIO)))
+            bucket = min(bucket, _NUM_BUCKETS - 1)
+
+        self._buckets[bucket] = self._buckets[bucket] + 1
+        self._count = self._count + 1
+        self._total = self._total + seconds
+        self._max   = max(self._max, seconds)
+
+
+    def percentile(self, percent):
+        """ Return the given percentile of our recorded latencies, in seconds.
+
+            The returned value is the upper bound of the histogram bucket the
+            percentile falls into, capped at the slowest latency recorded.
+        """
+        if self._count == 0:
+            return 0.0
+
+        target = self._count * percent / 100.0
+        seen = 0
+        for bucket in range(_NUM_BUCKETS):
+            seen = seen + self._buckets[bucket]
+            if seen >= target and seen > 0:
+                return min(FIRST_BUCKET * (BUCKET_RATIO ** bucket), self._max)
+        return self._max
+
+
+    def getSummary(self):
+        """ Return a dictionary summarizing our recorded latencies.
+
+            The dictionary has 'count', 'mean', 'p50', 'p95', 'p99' and 'max'
+            entries.  All the latencies are in milliseconds.
+        """
+        if self._count > 0:
+            mean = self._total / self._count
+        else:
+            mean = 0.0
+        return {'count' : self._count,
+                'mean'  : mean * 1000.0,
+                'p50'   : self.percentile(50) * 1000.0,
+                'p95'   : self.percentile(95) * 1000.0,
+                'p99'   : self.percentile(99) * 1000.0,
+                'max'   : self._max * 1000.0}
+
+#############################################################################
+
+class LatencyRecorder(object):
+    """ A collection of latency histograms, one per named operation.
+    """
+    def __init__(self, enabled=False):
+        """ Standard initializer.
+
+            If 'enabled' is False, nothing is recorded until enable() is
+            called.
+        """
+        self._enabled    = enabled
+        self._lock       = threading.Lock()
+        self._histograms = {} # Maps operation name -> LatencyHistogram.
+        self._timer      = None
+
+
+    def enable(self, enabled=True):
+        """ Switch the recording of latencies on or off.
+        """
+        self._enabled = enabled
+
+
+    def isEnabled(self):
+        """ Return True if we are recording latencies.
+        """
+        return self._enabled
+
+
+    def record(self, name, seconds):
+        """ Record a single latency for the given operation.
+        """
+        if not self._enabled:
+            return
+
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram == None:
+                histogram = LatencyHistogram()
+                self._histograms[name] = histogram
+            histogram.record(seconds)
+
+
+    @contextmanager
+    def timed(self, name):
+        """ A context manager which records how long its body takes to run.
+        """
+        if not self._enabled:
+            yield
+            return
+
+        startTime = _clock()
+        try:
+            yield
+        finally:
+            self.record(name, _clock() - startTime)
+
+
+    def wrap(self, name, func):
+        """ Return a version of 'func' which records how long each call takes.
+        """
+        def wrapper(*args, **kwargs):
+            if not self._enabled:
+                return func(*args, **kwargs)
+            startTime = _clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, _clock() - startTime)
+
+        wrapper.__name__ = getattr(func, "__name__", name)
+        wrapper.__doc__  = getattr(func, "__doc__", None)
+        return wrapper
+
+
+    def getSummary(self):
+        """ Return a summary of the latencies recorded so far.
+
+            We return a dictionary mapping each operation name to the summary
+            returned by LatencyHistogram.getSummary().
+        """
+        with self._lock:
+            summary = {}
+            for name,histogram in self._histograms.items():
+                summary[name] = histogram.getSummary()
+            return summary
+
+
+    def reset(self):
+        """ Throw away all the latencies recorded so far.
+        """
+        with self._lock:
+            self._histograms = {}
+
+
+    def dump(self, fileName):
+        """ Write a summary of the recorded latencies to the given JSON file.
+        """
+        f = open(fileName, "w")
+        try:
+            json.dump(self.getSummary(), f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+
+    def logSummary(self, logger=None):
+        """ Log a summary of the recorded latencies, one line per operation.
+        """
+        if logger == None:
+            logger = logging.getLogger("LatencyStats")
+
+        summary = self.getSummary()
+        for name in sorted(summary.keys()):
+            stats = summary[name]
+            logger.info("%s: count=%d p50=%.3fms p95=%.3fms p99=%.3fms max=%.3fms",
+                        name, stats['count'], stats['p50'], stats['p95'],
+                        stats['p99'], stats['max'])
+
+
+    def startPeriodicLogging(self, interval, logger=None):
+        """ Log a summary of the recorded latencies every 'interval' seconds.
+        """
+        self.stopPeriodicLogging()
+
+        def tick():
+            self.logSummary(logger)
+            self.startPeriodicLogging(interval, logger)
+
+        self._timer = threading.Timer(interval, tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+    def stopPeriodicLogging(self):
+        """ Stop logging our latencies periodically.
+        """
+        if self._timer != None:
+            self._timer.cancel()
+            self._timer = None
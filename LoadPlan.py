@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" LoadPlan.py
+
+    A plan of the lookups needed to load a job into its editor.
+
+    When a job is loaded, several of the editor's panels need to look things
+    up (the customer's POD attributes, the mileage between the zip codes and
+    so on).  If each panel does its own lookups as its field listeners are
+    called, the lookups are made one after another, and the time it takes to
+    open a job grows with the number of lookups.
+
+    Instead, before the job is loaded, each panel declares the lookups it
+    will need in a LoadPlan.  Each kind of lookup has a resolver function,
+    which looks up all the keys of that kind in one go (eg, with a single
+    "id IN (...)" query) and remembers the results where the panel's
+    listeners will find them.  Executing the plan runs the resolvers for the
+    different kinds of lookup at the same time.  Example:
+
+        plan = LoadPlan.LoadPlan()
+        detailsPanel.declareLookups(rec, plan)
+        ...
+        plan.execute()
+        editor.recordToPanel(rec)
+
+    If a resolver fails, the error is remembered (see getErrors()) and the
+    panels simply do their lookups the usual way.
+
+    This module doesn't use wx.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+#############################################################################
+
+class LoadPlan(object):
+    """ The lookups to perform before loading one or more job records.
+    """
+    def __init__(self):
+        """ Standard initializer.
+        """
+        self._lookups   = OrderedDict() # Maps kind -> (resolver, list of keys).
+        self._results   = {}            # Maps kind -> dictionary of results.
+        self._errors    = {}            # Maps kind -> exception.
+        self._executed  = False
+
+
+    def declare(self, kind, key, resolver):
+        """ Declare that a lookup will be needed.
+
+            'kind' is the name of the kind of lookup (eg, "customer"), and
+            'key' is the thing to look up (eg, the customer ID).  Each key is
+            only looked up once, however many times it is declared.
+
+            'resolver' is the function to use to look up the keys of this
+            kind.  It is called as resolver(keys), where 'keys' is a list of
+            the declared keys, and should return a dictionary mapping each
+            key to its result.  The resolver may be called on a background
+            thread.  Only the first resolver declared for each kind is used.
+        """
+        if key == None:
+            return
+        if kind not in self._lookups:
+            self._lookups[kind] = (resolver, [])
+        keys = self._lookups[kind][1]
+        if key not in keys:
+            keys.append(key)
+
+
+    def getKeys(self, kind):
+        """ Return the list of keys declared for the given kind of lookup.
+        """
+        if kind in self._lookups:
+            return list(self._lookups[kind][1])
+        else:
+            return []
+
+
+    def execute(self):
+        """ Perform all the declared lookups.
+
+            Each kind of lookup is resolved on its own thread, so that the
+            different kinds of lookup are done at the same time.  We return
+            once all the lookups are complete.
+        """
+        kinds = list(self._lookups.keys())
+        if len(kinds) == 0:
+            self._executed = True
+            return
+
+        threads = []
+        for kind in kinds[1:]:
+            thread = threading.Thread(target=self._resolve, args=(kind,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # Resolve the first kind of lookup ourselves, rather than waiting.
+        self._resolve(kinds[0])
+
+        for thread in threads:
+            thread.join()
+        self._executed = True
+
+
+    def isExecuted(self):
+        """ Return True if this plan has been executed.
+        """
+        return self._executed
+
+
+    def getResult(self, kind, key, default=None):
+        """ Return the result of the given lookup.
+
+            We return 'default' if the lookup wasn't declared or failed.
+        """
+        return self._results.get(kind, {}).get(key, default)
+
+
+    def getErrors(self):
+        """ Return a dictionary mapping each kind of lookup which failed to
+            the exception it raised.
+        """
+        return dict(self._errors)
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _resolve(self, kind):
+        """ Run the resolver for the given kind of lookup.
+        """
+        resolver,keys = self._lookups[kind]
+        try:
+            results = resolver(list(keys))
+        except Exception as err:
+            self._errors[kind] = err
+            return
+        if results == None:
+            results = {}
+        self._results[kind] = results
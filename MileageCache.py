@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" MileageCache.py
+
+    A bounded LRU cache of calculated mileages, keyed on the normalized
+    (pickup zip code, dropoff zip code) pair.
+
+    Dispatchers enter the same few hundred zip pairs over and over, so the
+    DetailsPanel consults this cache before asking the Calculator to work out
+    the mileage for a job.  The cache lives in memory and can optionally be
+    persisted to a file on the local disk so that it survives restarts.  New
+    mileages aren't written to disk as they are added; instead, call save()
+    (or startPeriodicSaving()) to write the cache out if it has changed, and
+    save it once more when the application exits.
+
+    The cache must be invalidated (by calling invalidate()) whenever the
+    zip/zone tables used by the Calculator change.  Alternatively, pass a
+    'tablesVersion' value when creating the cache; a cache file written for a
+    different version is discarded when it is loaded.
+"""
+
+import os
+import pickle
+import threading
+
+from collections import OrderedDict
+
+#############################################################################
+
+# Bump this whenever the format of the on-disk cache file changes.
+_FILE_FORMAT = 1
+
+#############################################################################
+
+def normalizeZipCode(zipCode):
+    """ Return the normalized form of the given zip code.
+
+        Zip codes may come through as integers or as strings with stray
+        whitespace; we convert them to a canonical string so that the same
+        zip code always maps onto the same cache key.  None is returned for
+        a missing zip code.
+    """
+    if zipCode in [-1, None]:
+        return None
+    zipCode = str(zipCode).strip()
+    if zipCode == "":
+        return None
+    return zipCode
+
+#############################################################################
+
+class MileageCache(object):
+    """ A bounded, optionally persistent, LRU cache of zip-pair mileages.
+    """
+    def __init__(self, maxSize=5000, path=None, tablesVersion=None):
+        """ Standard initializer.
+
+            'maxSize' is the maximum number of zip pairs to remember.  Once
+            this is exceeded, the least recently used pair is discarded.
+
+            'path', if given, is the name of a file on the local disk to load
+            the cache from and to save it to.
+
+            'tablesVersion' is an optional value identifying the version of
+            the zip/zone tables the cached mileages were calculated from.
+        """
+        self._maxSize       = maxSize
+        self._path          = path
+        self._tablesVersion = tablesVersion
+        self._entries       = OrderedDict() # Maps (pickup, dropoff) -> mileage.
+        self._lock          = threading.RLock()
+        self._saveLock      = threading.Lock() # Held while saving to disk.
+        self._dirty         = False # Changed since last saved?
+        self._timer         = None
+        self._hits          = 0
+        self._misses        = 0
+
+        if self._path != None:
+            self._load()
+
+
+    def get(self, pickupZipCode, dropoffZipCode):
+        """ Return the cached mileage for the given zip pair, or None.
+
+            Our hit/miss counters are updated as appropriate.
+        """
+        key = self._makeKey(pickupZipCode, dropoffZipCode)
+        if key == None:
+            return None
+
+        with self._lock:
+            mileage = self._entries.get(key)
+            if mileage == None:
+                self._misses = self._misses + 1
+                return None
+            # Move the entry to the most-recently-used end.
+            del self._entries[key]
+            self._entries[key] = mileage
+            self._hits = self._hits + 1
+            return mileage
+
+
+    def put(self, pickupZipCode, dropoffZipCode, mileage):
+        """ Remember the mileage for the given zip pair.
+
+            Unknown mileages (None) are not cached, so that we try again the
+            next time this zip pair is entered.
+        """
+        key = self._makeKey(pickupZipCode, dropoffZipCode)
+        if key == None or mileage == None:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+            self._entries[key] = mileage
+            while len(self._entries) > self._maxSize:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+
+    def lookup(self, pickupZipCode, dropoffZipCode, calculate):
+        """ Return the mileage for the given zip pair.
+
+            If the zip pair is not in the cache, we call 'calculate' (with the
+            pickup and dropoff zip codes as parameters) to obtain the mileage,
+            and remember the result for next time.
+        """
+        mileage = self.get(pickupZipCode, dropoffZipCode)
+        if mileage == None:
+            mileage = calculate(pickupZipCode, dropoffZipCode)
+            self.put(pickupZipCode, dropoffZipCode, mileage)
+        return mileage
+
+
+    def invalidate(self, tablesVersion=None):
+        """ Throw away everything in the cache.
+
+            This should be called whenever the zip/zone tables change.  If
+            'tablesVersion' is given, it becomes the new version of the tables
+            our mileages are calculated from.
+        """
+        with self._saveLock:
+            with self._lock:
+                self._entries.clear()
+                self._dirty = False
+                if tablesVersion != None:
+                    self._tablesVersion = tablesVersion
+
+            if self._path != None and os.path.exists(self._path):
+                try:
+                    os.remove(self._path)
+                except OSError:
+                    pass
+
+
+    def getStats(self):
+        """ Return a dictionary with statistics about our cache usage.
+
+            The dictionary has the following entries:
+
+                'size'    -- The number of zip pairs in the cache.
+                'hits'    -- The number of lookups answered from the cache.
+                'misses'  -- The number of lookups not in the cache.
+                'hitRate' -- The fraction of lookups answered from the cache.
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            if total > 0:
+                hitRate = float(self._hits) / total
+            else:
+                hitRate = 0.0
+            return {'size'    : len(self._entries),
+                    'hits'    : self._hits,
+                    'misses'  : self._misses,
+                    'hitRate' : hitRate}
+
+
+    def save(self):
+        """ Save the contents of the cache to our file on disk, if it has
+            changed since it was last saved.
+
+            We write to a temporary file and then rename it, so that a crash
+            part-way through never leaves a corrupt cache file behind.  Saves
+            are serialized, so this can safely be called from any thread.
+        """
+        if self._path == None:
+            return
+
+        with self._saveLock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                contents = {'format'        : _FILE_FORMAT,
+                            'tablesVersion' : self._tablesVersion,
+                            'entries'       : list(self._entries.items())}
+                self._dirty = False
+
+            tmpPath = "%s.%d.tmp" % (self._path, os.getpid())
+            try:
+                f = open(tmpPath, "wb")
+                try:
+                    pickle.dump(contents, f, pickle.HIGHEST_PROTOCOL)
+                finally:
+                    f.close()
+                if hasattr(os, "replace"):
+                    os.replace(tmpPath, self._path)
+                else:
+                    if os.path.exists(self._path):
+                        # os.rename() won't overwrite an existing file on
+                        # Windows.
+                        os.remove(self._path)
+                    os.rename(tmpPath, self._path)
+            except (IOError, OSError):
+                # The disk cache is only an optimization -> ignore failures,
+                # but try again next time.
+                with self._lock:
+                    self._dirty = True
+
+
+    def startPeriodicSaving(self, interval):
+        """ Save the cache every 'interval' seconds, if it has changed.
+        """
+        self.stopPeriodicSaving()
+
+        def tick():
+            self.save()
+            self.startPeriodicSaving(interval)
+
+        self._timer = threading.Timer(interval, tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+    def stopPeriodicSaving(self):
+        """ Stop saving the cache periodically.
+        """
+        if self._timer != None:
+            self._timer.cancel()
+            self._timer = None
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _makeKey(self, pickupZipCode, dropoffZipCode):
+        """ Return the cache key to use for the given zip pair.
+
+            We return None if either zip code is missing.
+        """
+        pickupZipCode  = normalizeZipCode(pickupZipCode)
+        dropoffZipCode = normalizeZipCode(dropoffZipCode)
+        if pickupZipCode == None or dropoffZipCode == None:
+            return None
+        return (pickupZipCode, dropoffZipCode)
+
+
+    def _load(self):
+        """ Load the contents of the cache from our file on disk.
+
+            A missing, unreadable or out-of-date cache file is ignored.
+        """
+        if not os.path.exists(self._path):
+            return
+
+        try:
+            f = open(self._path, "rb")
+            try:
+                contents = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            return
+
+        if not isinstance(contents, dict):
+            return
+        if contents.get("format") != _FILE_FORMAT:
+            return
+        if contents.get("tablesVersion") != self._tablesVersion:
+            return
+
+        with self._lock:
+            for key,mileage in contents.get("entries", []):
+                self._entries[key] = mileage
+            while len(self._entries) > self._maxSize:
+                self._entries.popitem(last=False)
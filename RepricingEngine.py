@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" RepricingEngine.py
+
+    A headless engine for recalculating the prices of many jobs at once.
+
+    The price fields shown in the DetailsPanel's price panel are all derived
+    from the job's mileage and the current rate tables:
+
+        mileage                  -- The distance between the pickup and
+                                    dropoff zip codes.
+        basePrice                -- The price for the mileage, from the
+                                    customer's rate table.
+        priceModifier            -- Any surcharges or discounts applied to
+                                    the base price.  This is taken as-is from
+                                    the job record.
+        calculatedPrice          -- basePrice + priceModifier.
+        defaultStandardBasePrice -- The price for the mileage, from our
+                                    standard rate table.
+        hasPriceOverride         -- Whether the price has been overridden.
+        priceOverride            -- The overridden price.
+        actualPrice              -- priceOverride if hasPriceOverride is set
+                                    and there is a price override, otherwise
+                                    calculatedPrice.
+
+    The reprice() function takes a list of job records (the same dictionaries
+    passed to DetailsPanel.recordToPanel() and panelToRecord()), and updates
+    the derived price fields in each one.  The arithmetic is done on NumPy
+    arrays a chunk of jobs at a time, and large batches are spread across a
+    pool of processes.
+
+    This module doesn't use wx, so it can be used from batch scripts -- for
+    example, to reprice all the open jobs after a rate table has changed.
+"""
+
+import multiprocessing
+
+from collections import OrderedDict
+
+#############################################################################
+
+# The price fields we calculate for each job.
+PRICE_FIELDS = ["basePrice", "calculatedPrice", "defaultStandardBasePrice",
+                "actualPrice"]
+
+# The number of jobs to reprice in each chunk of work.
+DEFAULT_CHUNK_SIZE = 5000
+
+# Batches with fewer jobs than this are repriced in the current process.
+MIN_JOBS_FOR_POOL = 20000
+
+#############################################################################
+
+class RateTable(object):
+    """ A table of prices by mileage.
+
+        The price is interpolated linearly between the given mileage
+        breakpoints.  Beyond the last breakpoint, 'perMileAfter' is charged
+        for each additional mile.
+    """
+    def __init__(self, mileages, prices, perMileAfter=0.0):
+        """ Standard initializer.
+
+            'mileages' is an ascending list of mileage breakpoints, and
+            'prices' is the price at each of these breakpoints.
+        """
+        if len(mileages) != len(prices) or len(mileages) == 0:
+            raise ValueError("RateTable needs one price per mileage breakpoint")
+
+        self.mileages     = list(mileages)
+        self.prices       = list(prices)
+        self.perMileAfter = perMileAfter
+
+
+    def calcPrices(self, mileages):
+        """ Return the prices for the given NumPy array of mileages.
+
+            The returned prices are rounded to the nearest cent.  A NaN
+            mileage results in a NaN price.
+        """
+        import numpy
+
+        prices = numpy.interp(mileages, self.mileages, self.prices)
+        extra  = numpy.maximum(mileages - self.mileages[-1], 0.0)
+        prices = prices + extra * self.perMileAfter
+        return numpy.round(prices, 2)
+
+#############################################################################
+
+def reprice(records, rateTable, standardRateTable=None, distanceMatrix=None,
+            numProcesses=None, chunkSize=DEFAULT_CHUNK_SIZE):
+    """ Recalculate the derived price fields for the given job records.
+
+        'records' is a list of job records.  Each record is updated in-place.
+
+        'rateTable' is the customers' rate table(s) to calculate the base
+        price from.  This can be any of the following:
+
+            - A single RateTable, used for every job.
+            - A dictionary mapping customer ID to that customer's RateTable.
+            - A function which is called with a customer ID, and returns
+              that customer's RateTable.
+
+        'standardRateTable' is the RateTable to calculate the standard base
+        price from.  If this is None, 'rateTable' must be a single RateTable,
+        which is used for both.  A ValueError is raised if there is no rate
+        table for one of the jobs' customers.
+
+        If 'distanceMatrix' is given, it should be a ZipDistanceMatrix; the
+        mileage for each job is then looked up afresh from the job's pickup
+        and dropoff zip codes.  Jobs whose zip codes aren't in the matrix
+        keep their existing mileage.
+
+        If there are at least MIN_JOBS_FOR_POOL records, the work is spread
+        across 'numProcesses' processes (by default, one per CPU).
+
+        We return the number of records whose prices were changed.
+    """
+    import numpy
+
+    if standardRateTable == None:
+        if not isinstance(rateTable, RateTable):
+            raise ValueError("A standardRateTable is needed when using " +
+                             "per-customer rate tables")
+        standardRateTable = rateTable
+
+    numJobs = len(records)
+    if numJobs == 0:
+        return 0
+
+    # Extract the input columns from our records.
+
+    mileages         = _floatColumn(records, "mileage")
+    priceModifiers   = _floatColumn(records, "priceModifier")
+    hasPriceOverride = numpy.array([_isTrue(rec.get("hasPriceOverride"))
+                                    for rec in records], dtype=bool)
+    priceOverrides   = _floatColumn(records, "priceOverride")
+
+    if distanceMatrix != None:
+        matrixMileages = distanceMatrix.lookupMany(
+                                [rec.get("pickupZipCode") for rec in records],
+                                [rec.get("dropoffZipCode") for rec in records])
+        found = ~numpy.isnan(matrixMileages)
+        mileages[found] = matrixMileages[found]
+
+    # Group the jobs by rate table, and split each group into chunks.  Each
+    # chunk is priced using a single rate table.
+
+    groups = OrderedDict() # Maps id(table) -> (table, list of job indexes).
+    for index,rec in enumerate(records):
+        table = _getRateTable(rateTable, rec.get("customer"))
+        if id(table) not in groups:
+            groups[id(table)] = (table, [])
+        groups[id(table)][1].append(index)
+
+    chunks       = []
+    chunkIndexes = [] # Array of job indexes for each chunk.
+    for table,indexes in groups.values():
+        indexes = numpy.array(indexes, dtype=numpy.int64)
+        for start in range(0, len(indexes), chunkSize):
+            jobs = indexes[start:start + chunkSize]
+            chunks.append((mileages[jobs], priceModifiers[jobs],
+                           hasPriceOverride[jobs], priceOverrides[jobs],
+                           table, standardRateTable))
+            chunkIndexes.append(jobs)
+
+    # Calculate the prices, a chunk at a time.
+
+    if numJobs >= MIN_JOBS_FOR_POOL and len(chunks) > 1:
+        pool = multiprocessing.Pool(numProcesses)
+        try:
+            results = pool.map(_repriceChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_repriceChunk(chunk) for chunk in chunks]
+
+    # Finally, copy the calculated values back into our records.
+
+    numChanged = 0
+    for jobs,columns in zip(chunkIndexes, results):
+        for i,index in enumerate(jobs):
+            rec = records[index]
+            changed = _setFloat(rec, "mileage", mileages[index])
+            for field in PRICE_FIELDS:
+                if _setFloat(rec, field, columns[field][i]):
+                    changed = True
+            if changed:
+                numChanged = numChanged + 1
+
+    return numChanged
+
+#############################################################################
+#                                                                           #
+#                    P R I V A T E   D E F I N I T I O N S                  #
+#                                                                           #
+#############################################################################
+
+def _repriceChunk(chunk):
+    """ Calculate the derived prices for one chunk of jobs.
+
+        'chunk' is a (mileages, priceModifiers, hasPriceOverride,
+        priceOverrides, rateTable, standardRateTable) tuple, where the first
+        four entries are NumPy arrays with one entry per job.  We return a
+        dictionary mapping each field in PRICE_FIELDS to a NumPy array of the
+        calculated values for that field.
+
+        This is a module-level function so that it can be run in a separate
+        process.
+    """
+    import numpy
+
+    mileages,priceModifiers,hasPriceOverride,priceOverrides, \
+        rateTable,standardRateTable = chunk
+
+    basePrices         = rateTable.calcPrices(mileages)
+    standardBasePrices = standardRateTable.calcPrices(mileages)
+    calculatedPrices   = numpy.round(basePrices +
+                                     numpy.nan_to_num(priceModifiers), 2)
+    useOverride        = hasPriceOverride & ~numpy.isnan(priceOverrides)
+    actualPrices       = numpy.where(useOverride, priceOverrides,
+                                     calculatedPrices)
+
+    return {'basePrice'                : basePrices,
+            'calculatedPrice'          : calculatedPrices,
+            'defaultStandardBasePrice' : standardBasePrices,
+            'actualPrice'              : actualPrices}
+
+
+def _getRateTable(rateTables, customer):
+    """ Return the RateTable to use for the given customer.
+
+        'rateTables' is a single RateTable, a dictionary mapping customer ID
+        to RateTable, or a function returning a customer's RateTable; see
+        reprice().
+    """
+    if isinstance(rateTables, RateTable):
+        table = rateTables
+    elif isinstance(rateTables, dict):
+        table = rateTables.get(customer)
+    else:
+        table = rateTables(customer)
+
+    if table == None:
+        raise ValueError("No rate table for customer %s" % customer)
+    return table
+
+
+def _floatColumn(records, field):
+    """ Return a NumPy array of the given field's value in each record.
+
+        Missing values are stored as NaN.
+    """
+    import numpy
+
+    values = []
+    for rec in records:
+        value = rec.get(field)
+        if value in [None, ""]:
+            values.append(numpy.nan)
+        else:
+            values.append(float(value))
+    return numpy.array(values, dtype=numpy.float64)
+
+
+def _setFloat(rec, field, value):
+    """ Store the given value into the given record field.
+
+        NaN values are stored as None.  We return True if the record's value
+        was changed.
+    """
+    if value != value: # NaN.
+        value = None
+    else:
+        value = float(value)
+
+    if rec.get(field) == value:
+        return False
+
+    rec[field] = value
+    return True
+
+
+def _isTrue(value):
+    """ Return True if the given boolean field value is set.
+
+        Boolean values may be stored as True/False or as "true"/"false".
+    """
+    return value == True or value == "true"
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" ZipDistanceMatrix.py
+
+    A precomputed matrix of the distances between every pair of zip codes in
+    our service area.
+
+    The matrix is built ahead of time from a table of zip code centroids (see
+    build(), below), and is stored on disk as two NumPy files:
+
+        <name>.zips.npy  -- The sorted list of zip codes in the matrix.
+        <name>.miles.npy -- An N x N matrix of float32 mileages, where the
+                            mileage from zips[i] to zips[j] is in row i,
+                            column j.
+
+    At run time, a ZipDistanceMatrix object memory-maps these two files and
+    looks up mileages in them; nothing is read into memory until a lookup
+    actually needs it, so opening the matrix is cheap.  Use lookup() to find
+    the mileage for a single zip pair, or lookupMany() to find the mileages
+    for arrays of zip pairs in one call.
+
+    To build the matrix files, run this module as a script:
+
+        python ZipDistanceMatrix.py centroids.csv <name> [circuity]
+
+    where 'centroids.csv' has one "zipCode,latitude,longitude" line per zip
+    code in our service area, and 'circuity' is the factor to multiply the
+    straight-line centroid distances by to approximate road mileage (1.0 by
+    default).
+"""
+
+import os
+import sys
+
+import MileageCache
+
+#############################################################################
+
+# The mean radius of the Earth, in miles.
+EARTH_RADIUS = 3958.8
+
+# The width of the zip code strings stored in the matrix.
+ZIP_CODE_WIDTH = 10
+
+# The number of matrix rows to calculate at once while building the matrix.
+BUILD_BLOCK_SIZE = 256
+
+#############################################################################
+
+def getMatrixPaths(name):
+    """ Return the (zipsPath, milesPath) file names for the given matrix.
+    """
+    return (name + ".zips.npy", name + ".miles.npy")
+
+
+def build(centroids, name, circuity=1.0):
+    """ Build the distance matrix files for the given zip code centroids.
+
+        'centroids' is a dictionary mapping each zip code to a (latitude,
+        longitude) tuple, in degrees.  'name' is the name of the matrix to
+        build; see getMatrixPaths() for the files this creates.  The great
+        circle distance between each pair of centroids is multiplied by
+        'circuity' to approximate the road mileage.
+    """
+    import numpy
+
+    zipCodes = sorted(set([MileageCache.normalizeZipCode(zipCode)
+                           for zipCode in centroids.keys()]))
+    if None in zipCodes:
+        zipCodes.remove(None)
+
+    coords = {}
+    for zipCode,latLong in centroids.items():
+        coords[MileageCache.normalizeZipCode(zipCode)] = latLong
+
+    lats = numpy.radians(numpy.array([coords[z][0] for z in zipCodes],
+                                     dtype=numpy.float64))
+    longs = numpy.radians(numpy.array([coords[z][1] for z in zipCodes],
+                                      dtype=numpy.float64))
+
+    zipsPath,milesPath = getMatrixPaths(name)
+    numpy.save(zipsPath, numpy.array(zipCodes, dtype="S%d" % ZIP_CODE_WIDTH))
+
+    numZips = len(zipCodes)
+    miles = numpy.lib.format.open_memmap(milesPath, mode="w+",
+                                         dtype=numpy.float32,
+                                         shape=(numZips, numZips))
+
+    # Calculate the haversine distances a block of rows at a time, so that we
+    # don't need several N x N temporary arrays in memory at once.
+
+    cosLats = numpy.cos(lats)
+    for start in range(0, numZips, BUILD_BLOCK_SIZE):
+        end = min(start + BUILD_BLOCK_SIZE, numZips)
+        dLat  = lats[numpy.newaxis, :] - lats[start:end, numpy.newaxis]
+        dLong = longs[numpy.newaxis, :] - longs[start:end, numpy.newaxis]
+        a = (numpy.sin(dLat / 2.0) ** 2 +
+             cosLats[start:end, numpy.newaxis] * cosLats[numpy.newaxis, :] *
+             numpy.sin(dLong / 2.0) ** 2)
+        dist = 2.0 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+        miles[start:end, :] = dist * circuity
+
+    miles.flush()
+    del miles
+
+
+def loadCentroids(fileName):
+    """ Load a table of zip code centroids from the given CSV file.
+
+        Each line of the file should contain "zipCode,latitude,longitude".
+        Blank lines, and lines that don't start with a number (eg, a header
+        line), are ignored.  We return a dictionary mapping each zip code to
+        a (latitude, longitude) tuple.
+    """
+    centroids = {}
+    f = open(fileName, "r")
+    try:
+        for line in f:
+            parts = [part.strip() for part in line.split(",")]
+            if len(parts) < 3 or not parts[0][:1].isdigit():
+                continue
+            centroids[parts[0]] = (float(parts[1]), float(parts[2]))
+    finally:
+        f.close()
+    return centroids
+
+#############################################################################
+
+class ZipDistanceMatrix(object):
+    """ A memory-mapped, precomputed zip-to-zip distance matrix.
+    """
+    def __init__(self, name):
+        """ Standard initializer.
+
+            'name' is the name of the matrix, as passed to build().  The
+            matrix files aren't opened until the first lookup.
+        """
+        self._zipsPath,self._milesPath = getMatrixPaths(name)
+        self._zips  = None
+        self._miles = None
+
+
+    def exists(self):
+        """ Return True if the files for this matrix have been built.
+        """
+        return (os.path.exists(self._zipsPath) and
+                os.path.exists(self._milesPath))
+
+
+    def lookup(self, pickupZipCode, dropoffZipCode):
+        """ Return the mileage between the two given zip codes.
+
+            We return None if either zip code isn't in the matrix.
+        """
+        pickupZipCode  = MileageCache.normalizeZipCode(pickupZipCode)
+        dropoffZipCode = MileageCache.normalizeZipCode(dropoffZipCode)
+        if pickupZipCode == None or dropoffZipCode == None:
+            return None
+
+        self._open()
+        row = self._indexOf(pickupZipCode)
+        col = self._indexOf(dropoffZipCode)
+        if row == None or col == None:
+            return None
+        return float(self._miles[row, col])
+
+
+    def lookupMany(self, pickupZipCodes, dropoffZipCodes):
+        """ Return the mileages for several zip pairs at once.
+
+            'pickupZipCodes' and 'dropoffZipCodes' are equal-length sequences
+            (or NumPy arrays) of zip codes.  We return a NumPy float array of
+            the mileage for each pair, with NaN for pairs that aren't in the
+            matrix.
+        """
+        import numpy
+
+        self._open()
+        rows,rowsFound = self._indicesOf(pickupZipCodes)
+        cols,colsFound = self._indicesOf(dropoffZipCodes)
+        found = rowsFound & colsFound
+
+        mileages = numpy.empty(len(rows), dtype=numpy.float64)
+        mileages.fill(numpy.nan)
+        mileages[found] = self._miles[rows[found], cols[found]]
+        return mileages
+
+    # =====================
+    # == PRIVATE METHODS ==
+    # =====================
+
+    def _open(self):
+        """ Memory-map our matrix files, if we haven't done so already.
+        """
+        if self._miles is not None:
+            return
+
+        import numpy
+        self._zips  = numpy.load(self._zipsPath, mmap_mode="r")
+        self._miles = numpy.load(self._milesPath, mmap_mode="r")
+
+
+    def _indexOf(self, zipCode):
+        """ Return the matrix index for the given normalized zip code, or None.
+        """
+        import numpy
+
+        key = numpy.array([zipCode.encode("ascii")], dtype=self._zips.dtype)
+        index = int(numpy.searchsorted(self._zips, key)[0])
+        if index < len(self._zips) and self._zips[index] == key[0]:
+            return index
+        return None
+
+
+    def _indicesOf(self, zipCodes):
+        """ Return the matrix indices for the given zip codes.
+
+            We return an (indices, found) tuple of NumPy arrays, where
+            'found' is True for each zip code that is in the matrix.
+        """
+        import numpy
+
+        if len(self._zips) == 0:
+            return (numpy.zeros(len(zipCodes), dtype=numpy.int64),
+                    numpy.zeros(len(zipCodes), dtype=bool))
+
+        keys = []
+        for zipCode in zipCodes:
+            zipCode = MileageCache.normalizeZipCode(zipCode)
+            if zipCode == None:
+                zipCode = ""
+            keys.append(zipCode.encode("ascii"))
+        keys = numpy.array(keys, dtype=self._zips.dtype)
+
+        indices = numpy.searchsorted(self._zips, keys)
+        indices = numpy.minimum(indices, len(self._zips) - 1)
+        found   = (self._zips[indices] == keys) & (keys != b"")
+        return (indices, found)
+
+#############################################################################
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [3, 4]:
+        print("Usage: python ZipDistanceMatrix.py centroids.csv <name> [circuity]")
+        sys.exit(1)
+
+    if len(sys.argv) == 4:
+        circuity = float(sys.argv[3])
+    else:
+        circuity = 1.0
+
+    build(loadCentroids(sys.argv[1]), sys.argv[2], circuity)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" DetailsPanelBenchmark.py
+
+    A headless benchmark suite for the DetailsPanel.
+
+    The DetailsPanel is run against the stand-in wx module and Framework
+    services in FakeServices.py, so this runs on any machine with Python --
+    no display, wx installation or database is needed.  Database and
+    calculator latency are simulated using the --db-latency and
+    --calc-latency options.
+
+    We measure:
+
+        import          -- Importing DetailsPanel, and which shared modules
+                           it fetches from the Framework while doing so.
+        construct       -- Creating a DetailsPanel, with and without
+                           building its input fields.
+        recordToPanel   -- Loading each job in a synthetic corpus of job
+                           records into the panel.
+        panelToRecord   -- Copying the panel's fields back into a record.
+        panelToDelta    -- Working out which fields have changed.
+        zipListener     -- Changing the pickup zip code, up to the point the
+                           new mileage has been delivered back to the panel.
+        customerListener -- Changing the customer.
+        jobOpen         -- Opening a job with cold and warm caches, up to
+                           the point its mileage has been displayed, both
+                           with and without a LoadPlan prefetching its
+                           lookups.
+
+    The results are written as JSON (to stdout, or to the file given by
+    --output), so that runs against different versions can be compared.
+    Usage:
+
+        python benchmarks/DetailsPanelBenchmark.py [--jobs N] [--seed N]
+                [--db-latency MS] [--calc-latency MS] [--output FILE]
+"""
+
+import json
+import optparse
+import platform
+import time
+
+import FakeServices
+
+#############################################################################
+
+_clock = getattr(time, "perf_counter", time.time)
+
+#############################################################################
+
+def main():
+    """ Run the benchmark suite.
+    """
+    parser = optparse.OptionParser()
+    parser.add_option("--jobs", type="int", default=2000,
+                      help="number of synthetic job records to use")
+    parser.add_option("--seed", type="int", default=1,
+                      help="random seed for the synthetic job records")
+    parser.add_option("--db-latency", type="float", default=0.0,
+                      help="simulated Database.select latency, in ms")
+    parser.add_option("--calc-latency", type="float", default=0.0,
+                      help="simulated calculateMileage latency, in ms")
+    parser.add_option("--panels", type="int", default=200,
+                      help="number of panels to construct")
+    parser.add_option("--output", default=None,
+                      help="file to write the JSON results to")
+    options,args = parser.parse_args()
+
+    FakeServices.install(dbLatency=options.db_latency / 1000.0,
+                         calcLatency=options.calc_latency / 1000.0)
+
+    startTime = _clock()
+    import DetailsPanel
+    importTime = _clock() - startTime
+    fetchedAtImport = list(FakeServices.FakeFramework.fetched)
+
+    # Don't debounce the background mileage calculations, so that we measure
+    # how long a calculation actually takes rather than the debounce delay.
+    DetailsPanel.setMileageDebounceDelay(0.0)
+
+    records = FakeServices.makeJobRecords(options.jobs, options.seed)
+
+    results = {'python'     : platform.python_version(),
+               'timestamp'  : time.strftime("%Y-%m-%dT%H:%M:%S"),
+               'parameters' : {'jobs'        : options.jobs,
+                               'seed'        : options.seed,
+                               'panels'      : options.panels,
+                               'dbLatency'   : options.db_latency,
+                               'calcLatency' : options.calc_latency},
+               'benchmarks' : {}}
+
+    benchmarks = results['benchmarks']
+    benchmarks['import']           = {'ms'      : importTime * 1000.0,
+                                      'fetched' : fetchedAtImport}
+    benchmarks['construct']        = benchConstruct(DetailsPanel, options.panels)
+    benchmarks['recordToPanel']    = benchRecordToPanel(DetailsPanel, records)
+    benchmarks['panelToRecord']    = benchPanelToRecord(DetailsPanel, records)
+    benchmarks['panelToDelta']     = benchPanelToDelta(DetailsPanel, records)
+    benchmarks['zipListener']      = benchZipListener(DetailsPanel, records)
+    benchmarks['customerListener'] = benchCustomerListener(DetailsPanel, records)
+    benchmarks['jobOpen']          = benchJobOpen(DetailsPanel, records)
+
+    results['counters'] = {'databaseSelects'     : FakeServices.FakeDatabase.numSelects,
+                           'mileageCalculations' : FakeServices.FakeCalculator.numCalculations,
+                           'mileageCache'        : DetailsPanel.getMileageCacheStats(),
+                           'customerCache'       : DetailsPanel.getCustomerCacheStats()}
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output != None:
+        f = open(options.output, "w")
+        try:
+            f.write(output + "\n")
+        finally:
+            f.close()
+    else:
+        print(output)
+
+#############################################################################
+
+def benchConstruct(DetailsPanel, numPanels):
+    """ Measure how long it takes to create a DetailsPanel.
+    """
+    unbuilt = []
+    built   = []
+    for i in range(numPanels):
+        editor = FakeServices.FakeEditor()
+        startTime = _clock()
+        panel = DetailsPanel.DetailsPanel(None, editor)
+        unbuilt.append(_clock() - startTime)
+
+        startTime = _clock()
+        panel.buildFields()
+        built.append(_clock() - startTime + unbuilt[-1])
+        FakeServices.pumpEvents()
+
+    return {'unbuilt' : _summarize(unbuilt),
+            'built'   : _summarize(built)}
+
+
+def benchRecordToPanel(DetailsPanel, records):
+    """ Measure how long it takes to load each job into a DetailsPanel.
+    """
+    panel = _makePanel(DetailsPanel)
+    times = []
+    for rec in records:
+        startTime = _clock()
+        panel.recordToPanel(rec)
+        times.append(_clock() - startTime)
+        _drainWorker(panel)
+    return _summarize(times)
+
+
+def benchPanelToRecord(DetailsPanel, records):
+    """ Measure how long it takes to copy a DetailsPanel back into a record.
+    """
+    panel = _makePanel(DetailsPanel)
+    times = []
+    for rec in records:
+        panel.recordToPanel(rec)
+        _drainWorker(panel)
+        startTime = _clock()
+        panel.panelToRecord(dict(rec))
+        times.append(_clock() - startTime)
+    return _summarize(times)
+
+
+def benchPanelToDelta(DetailsPanel, records):
+    """ Measure how long it takes to find the changed fields in a panel.
+    """
+    panel = _makePanel(DetailsPanel)
+    times = []
+    for rec in records:
+        panel.recordToPanel(rec)
+        _drainWorker(panel)
+        panel.setFieldValue("recipientsName", "Someone Else")
+        startTime = _clock()
+        panel.panelToDelta()
+        times.append(_clock() - startTime)
+    return _summarize(times)
+
+
+def benchZipListener(DetailsPanel, records):
+    """ Measure how long it takes to respond to a changed pickup zip code.
+
+        We measure both the time spent in the listener itself (which is what
+        blocks the GUI), and the time until the new mileage is displayed.
+    """
+    editor = FakeServices.FakeEditor()
+    panel  = DetailsPanel.DetailsPanel(None, editor)
+    panel.buildFields()
+    FakeServices.pumpEvents()
+
+    listenerTimes = []
+    mileageTimes  = []
+    for rec in records:
+        panel.recordToPanel(rec)
+        _drainWorker(panel)
+        editor.changeField("dropoffZipCode", rec['dropoffZipCode'])
+
+        startTime = _clock()
+        editor.changeField("pickupZipCode", rec['pickupZipCode'])
+        listenerTimes.append(_clock() - startTime)
+        _drainWorker(panel)
+        mileageTimes.append(_clock() - startTime)
+
+    return {'listener'       : _summarize(listenerTimes),
+            'mileageUpdated' : _summarize(mileageTimes)}
+
+
+def benchCustomerListener(DetailsPanel, records):
+    """ Measure how long it takes to respond to a changed customer.
+    """
+    editor = FakeServices.FakeEditor()
+    panel  = DetailsPanel.DetailsPanel(None, editor)
+    panel.buildFields()
+    FakeServices.pumpEvents()
+
+    times = []
+    for rec in records:
+        startTime = _clock()
+        editor.changeField("customer", rec['customer'])
+        times.append(_clock() - startTime)
+    return _summarize(times)
+
+
+def benchJobOpen(DetailsPanel, records, numJobs=200):
+    """ Measure how long it takes to open a job, up to the point its
+        mileage has been displayed.
+
+        Each job is opened with cold caches (its customer and mileage not
+        cached) and with warm caches, and each of these twice: once letting
+        the panel's listeners do their own lookups, and once executing a
+        LoadPlan first.  We also measure the time until the job has loaded
+        and the GUI is free again ('interactive'), and count the database
+        selects each open makes.
+    """
+    import LoadPlan
+
+    editor = FakeServices.FakeEditor()
+    panel  = DetailsPanel.DetailsPanel(None, editor)
+    panel.buildFields()
+    FakeServices.pumpEvents()
+
+    def openJob(rec, usePlan, cold):
+        if cold:
+            DetailsPanel.invalidateCustomer()
+            DetailsPanel.invalidateMileageCache()
+        else:
+            DetailsPanel.prefetchCustomers([rec['customer']])
+            DetailsPanel._mileageCache.lookup(rec['pickupZipCode'],
+                                              rec['dropoffZipCode'],
+                                              DetailsPanel._calculateMileage)
+        numSelects = FakeServices.FakeDatabase.numSelects
+        startTime  = _clock()
+        if usePlan:
+            plan = LoadPlan.LoadPlan()
+            panel.declareLookups(rec, plan)
+            plan.execute()
+        panel.beginBatch()
+        try:
+            panel.recordToPanel(rec)
+            for field in ["customer", "pickupZipCode", "dropoffZipCode"]:
+                editor.changeField(field, rec[field])
+        finally:
+            panel.endBatch()
+        FakeServices.pumpEvents()
+        interactiveTime = _clock() - startTime
+        _drainWorker(panel)
+        return (interactiveTime, _clock() - startTime,
+                FakeServices.FakeDatabase.numSelects - numSelects)
+
+    results = {}
+    for name,cold in [("cold", True), ("warm", False)]:
+        for usePlan in [False, True]:
+            interactiveTimes = []
+            times            = []
+            selects          = 0
+            for rec in records[:numJobs]:
+                interactive,elapsed,numSelects = openJob(rec, usePlan, cold)
+                interactiveTimes.append(interactive)
+                times.append(elapsed)
+                selects = selects + numSelects
+            summary = _summarize(times)
+            summary['interactive']     = _summarize(interactiveTimes)
+            summary['databaseSelects'] = selects
+            if usePlan:
+                results[name + "WithPlan"] = summary
+            else:
+                results[name + "WithoutPlan"] = summary
+    return results
+
+#############################################################################
+#                                                                           #
+#                    P R I V A T E   D E F I N I T I O N S                  #
+#                                                                           #
+#############################################################################
+
+def _makePanel(DetailsPanel):
+    """ Return a new DetailsPanel, with its input fields built.
+    """
+    panel = DetailsPanel.DetailsPanel(None, FakeServices.FakeEditor())
+    panel.buildFields()
+    FakeServices.pumpEvents()
+    return panel
+
+
+def _drainWorker(panel):
+    """ Wait for the panel's background mileage calculation to be delivered.
+    """
+    FakeServices.pumpEvents()
+    while panel.isMileagePending():
+        time.sleep(0.0001)
+        FakeServices.pumpEvents()
+
+
+def _summarize(times):
+    """ Return a dictionary summarizing the given list of times, in seconds.
+
+        The summary's times are in milliseconds.
+    """
+    if len(times) == 0:
+        return {'count' : 0}
+
+    times = sorted(times)
+    total = sum(times)
+
+    def percentile(percent):
+        index = min(int(len(times) * percent / 100.0), len(times) - 1)
+        return times[index] * 1000.0
+
+    return {'count'     : len(times),
+            'mean'      : total / len(times) * 1000.0,
+            'p50'       : percentile(50),
+            'p95'       : percentile(95),
+            'p99'       : percentile(99),
+            'max'       : times[-1] * 1000.0,
+            'perSecond' : len(times) / total if total > 0 else None}
+
+#############################################################################
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+""" FakeServices.py
+
+    Stand-in versions of the services DetailsPanel.py depends on, so that the
+    panel can be exercised without a live wx application or the rest of the
+    dispatch framework.
+
+    Calling install() sets up the following:
+
+        wx          -- A minimal stand-in for the wx module, providing the
+                       window methods and event constants DetailsPanel uses.
+                       wx.CallAfter() queues calls until pumpEvents() is
+                       called, simulating the wx event loop.
+
+        Framework   -- A stand-in for the dispatch framework, installed as a
+                       builtin in the same way the real framework makes it
+                       available to the modules it loads.  Framework.get()
+                       returns our fake "shared.Editor", "shared.Database"
+                       and "shared.Calculator" modules.
+
+    FakeDatabase.select() and FakeCalculator.calculateMileage() sleep for a
+    configurable time to simulate database and calculator latency, and count
+    how many times they are called.
+"""
+
+import os
+import random
+import sys
+import time
+import types
+
+try:
+    import __builtin__ as builtins # Python 2.
+except ImportError:
+    import builtins
+
+#############################################################################
+
+_pendingCalls = [] # Calls queued by wx.CallAfter().
+
+#############################################################################
+
+def install(dbLatency=0.0, calcLatency=0.0):
+    """ Install our fake wx module and Framework.
+
+        'dbLatency' and 'calcLatency' are the number of seconds each database
+        select and mileage calculation should take.
+
+        This must be called before DetailsPanel is imported.
+    """
+    FakeDatabase.latency   = dbLatency
+    FakeCalculator.latency = calcLatency
+
+    sys.modules["wx"] = _makeWxModule()
+    builtins.Framework = FakeFramework
+
+    # Make the modules at the top of the repository importable.
+    topDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if topDir not in sys.path:
+        sys.path.insert(0, topDir)
+
+
+def pumpEvents():
+    """ Run all the calls queued by wx.CallAfter(), as the wx event loop would.
+
+        We return the number of calls that were run.
+    """
+    numCalls = 0
+    while len(_pendingCalls) > 0:
+        func,args,kwargs = _pendingCalls.pop(0)
+        func(*args, **kwargs)
+        numCalls = numCalls + 1
+    return numCalls
+
+#############################################################################
+
+class FakeWindow(object):
+    """ A stand-in for wx.Window.
+    """
+    def __init__(self, parent=None, *args, **kwargs):
+        self._parent = parent
+        self._shown  = True
+
+    def Bind(self, event, handler, *args, **kwargs):
+        pass
+
+    def Freeze(self):
+        pass
+
+    def Thaw(self):
+        pass
+
+    def Show(self, show=True):
+        self._shown = show
+
+    def Hide(self):
+        self._shown = False
+
+    def IsShownOnScreen(self):
+        return self._shown
+
+    def Reparent(self, parent):
+        self._parent = parent
+
+    def Destroy(self):
+        pass
+
+    def __bool__(self):
+        return True
+
+    __nonzero__ = __bool__
+
+#############################################################################
+
+class FakeInputField(FakeWindow):
+    """ A stand-in for the shared.Editor input field classes.
+    """
+    def __init__(self, parent, *args, **kwargs):
+        FakeWindow.__init__(self, parent)
+        self._value    = None
+        self._readOnly = False
+
+    def getValue(self):
+        return self._value
+
+    def setValue(self, value):
+        self._value = value
+
+    def setReadOnly(self, readOnly=True):
+        self._readOnly = readOnly
+
+
+class FakeInputPanel(FakeWindow):
+    """ A stand-in for shared.Editor.InputPanel.
+    """
+    def __init__(self, parent):
+        FakeWindow.__init__(self, parent)
+        self._fields = [] # List of (field, key) tuples.
+
+    def addField(self, label, field, key):
+        self._fields.append((field, key))
+
+    def addVerticalGap(self, height):
+        pass
+
+    def startRow(self):
+        pass
+
+    def endRow(self):
+        pass
+
+    def layout(self):
+        pass
+
+    def recordToPanel(self, rec):
+        for field,key in self._fields:
+            if key == None:
+                FakeInputPanel.recordToPanel(field, rec)
+            else:
+                field.setValue(rec.get(key))
+
+    def panelToRecord(self, rec):
+        for field,key in self._fields:
+            if key == None:
+                FakeInputPanel.panelToRecord(field, rec)
+            else:
+                rec[key] = field.getValue()
+
+    def setFieldValue(self, fieldKey, value):
+        for field,key in self._fields:
+            if key == fieldKey:
+                field.setValue(value)
+
+
+class FakeEditor(object):
+    """ A stand-in for the job editor a DetailsPanel belongs to.
+    """
+    def __init__(self):
+        self._listeners = {} # Maps field -> list of listeners.
+        self._values    = {}
+
+    def registerFieldListener(self, field, listener):
+        self._listeners.setdefault(field, []).append(listener)
+
+    def unregisterFieldListener(self, field, listener):
+        self._listeners[field].remove(listener)
+
+    def getFieldValue(self, field):
+        return self._values.get(field)
+
+    def fieldChanged(self, field, value):
+        self._values[field] = value
+
+    def changeField(self, field, value):
+        """ Simulate the user changing the given field in another panel.
+        """
+        self._values[field] = value
+        for listener in list(self._listeners.get(field, [])):
+            listener(value)
+
+#############################################################################
+
+class FakeDatabase(object):
+    """ A stand-in for shared.Database.
+    """
+    latency    = 0.0
+    numSelects = 0
+
+    @staticmethod
+    def select(table, columns, where):
+        FakeDatabase.numSelects = FakeDatabase.numSelects + 1
+        if FakeDatabase.latency > 0:
+            time.sleep(FakeDatabase.latency)
+
+        if where.startswith("id="):
+            ids = [where[3:]]
+        elif where.startswith("id IN ("):
+            ids = where[7:-1].split(",")
+        else:
+            ids = [str(customerId) for customerId in range(1, NUM_CUSTOMERS + 1)]
+
+        rows = []
+        for customerId in ids:
+            row = {'id' : customerId}
+            for column in columns:
+                if column != "id":
+                    flag = (int(customerId) + len(column)) % 2
+                    row[column] = ["false", "true"][flag]
+            rows.append(row)
+        return rows
+
+
+class FakeCalculator(object):
+    """ A stand-in for shared.Calculator.
+    """
+    latency         = 0.0
+    numCalculations = 0
+
+    @staticmethod
+    def calculateMileage(pickupAddress, pickupZone, pickupZipCode,
+                         dropoffAddress, dropoffZone, dropoffZipCode):
+        FakeCalculator.numCalculations = FakeCalculator.numCalculations + 1
+        if FakeCalculator.latency > 0:
+            time.sleep(FakeCalculator.latency)
+        return float(abs(int(pickupZipCode) - int(dropoffZipCode)) % 97) + 0.5
+
+
+class FakeFramework(object):
+    """ A stand-in for the dispatch framework.
+    """
+    fetched = [] # The names passed to get(), in order.
+
+    @staticmethod
+    def get(name):
+        FakeFramework.fetched.append(name)
+        return _sharedModules[name]
+
+#############################################################################
+
+# The number of customers in our fake database.
+NUM_CUSTOMERS = 500
+
+def makeJobRecords(numJobs, seed=1):
+    """ Return a list of synthetic job records for benchmarking.
+
+        The same 'seed' always produces the same records.  Zip codes are drawn
+        from a small pool, as real dispatchers enter the same zip pairs over
+        and over.
+    """
+    rand = random.Random(seed)
+    zipCodes = ["%05d" % rand.randint(10000, 99999) for i in range(60)]
+
+    records = []
+    for i in range(numJobs):
+        readyAt = 1443500000 + rand.randint(0, 86400 * 30)
+        records.append({
+            'id'                       : i + 1,
+            'customer'                 : rand.randint(1, NUM_CUSTOMERS),
+            'pickupZipCode'            : rand.choice(zipCodes),
+            'dropoffZipCode'           : rand.choice(zipCodes),
+            'recipientsName'           : "Recipient %d" % rand.randint(1, 9999),
+            'isPrebooked'              : rand.random() < 0.2,
+            'readyAt'                  : readyAt,
+            'deliverBy'                : readyAt + rand.choice([3600, 7200, 14400]),
+            'timeEntered'              : readyAt - 600,
+            'timeAcknowledged'         : readyAt - 300,
+            'timePickedUp'             : readyAt + 900,
+            'calculatedDeliveryTime'   : readyAt + 3600,
+            'hasDeliveryTimeOverride'  : rand.random() < 0.05,
+            'deliveryTimeOverride'     : None,
+            'actualDeliveryTime'       : readyAt + 3700,
+            'lateJobExempt'            : rand.random() < 0.02,
+            'okayToLeave'              : rand.random() < 0.5,
+            'requiresPOD'              : rand.random() < 0.3,
+            'requiresPODWithCallBack'  : False,
+            'requiresPODWithEmailBack' : False,
+            'roundTrip'                : rand.random() < 0.1,
+            'mileage'                  : round(rand.uniform(1, 80), 1),
+            'basePrice'                : round(rand.uniform(10, 200), 2),
+            'priceModifier'            : 0.0,
+            'calculatedPrice'          : round(rand.uniform(10, 200), 2),
+            'defaultStandardBasePrice' : round(rand.uniform(10, 200), 2),
+            'hasPriceOverride'         : rand.random() < 0.1,
+            'priceOverride'            : None,
+            'actualPrice'              : round(rand.uniform(10, 200), 2),
+        })
+    return records
+
+#############################################################################
+#                                                                           #
+#                    P R I V A T E   D E F I N I T I O N S                  #
+#                                                                           #
+#############################################################################
+
+def _makeWxModule():
+    """ Return our stand-in for the wx module.
+    """
+    wx = types.ModuleType("wx")
+    wx.Window    = FakeWindow
+    wx.Panel     = FakeWindow
+    wx.Frame     = FakeWindow
+    wx.EVT_SHOW  = object()
+    wx.CallAfter = lambda func, *args, **kwargs: \
+                        _pendingCalls.append((func, args, kwargs))
+    return wx
+
+
+def _makeEditorModule():
+    """ Return our stand-in for the shared.Editor module.
+    """
+    editor = types.ModuleType("shared.Editor")
+    editor.InputPanel = FakeInputPanel
+    for name in ["BooleanInputField", "DateTimeInputField", "DateSelector",
+                 "DatePickerCtrl", "PopupInputField", "MoneyInputField",
+                 "FloatInputField", "DisplayField", "TextInputField"]:
+        setattr(editor, name, type(name, (FakeInputField,), {}))
+    return editor
+
+
+_sharedModules = {'shared.Editor'     : _makeEditorModule(),
+                  'shared.Database'   : FakeDatabase,
+                  'shared.Calculator' : FakeCalculator}